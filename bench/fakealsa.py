@@ -0,0 +1,186 @@
+"""
+	fakealsa.py (an in-memory stand-in for the alsaaudio module)
+
+	Simulates a number of sound cards with a number of mixer elements each.
+	Every call that would be an ioctl on real hardware is counted in
+	'calls' and can be slowed down by a fixed latency, so benchmarks can
+	measure the cost of the hot paths on a machine without sound hardware.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import sys, time
+
+PCM_PLAYBACK = 0
+PCM_CAPTURE = 1
+
+ELEMENT_NAMES = ('Master', 'Headphone', 'PCM', 'Front', 'Surround',
+	'Center', 'LFE', 'Line', 'CD', 'Mic', 'Mic Boost', 'Capture',
+	'Beep', 'Auto-Mute Mode', 'Loopback Mixing')
+
+calls = {}
+latency = 0.0
+card_names = []
+elements = {}
+values = {}
+
+
+class ALSAAudioError(Exception):
+	pass
+
+
+def install(ncards=2, nelements=20, call_latency=0.0):
+	"""
+	Simulate 'ncards' cards with 'nelements' elements each and make this
+	module the one imported as alsaaudio.  'call_latency' is in seconds.
+	"""
+	global latency
+	latency = call_latency
+	del card_names[:]
+	elements.clear()
+	values.clear()
+	for card in range(ncards):
+		card_names.append('Card%d' % card)
+		names = []
+		for n in range(nelements):
+			if n < len(ELEMENT_NAMES):
+				name = ELEMENT_NAMES[n]
+			else:
+				name = 'Element %d' % n
+			# Every fifth element is a switch without a volume, every
+			# third is mono, capture elements have a rec switch.
+			elements[(card, name)] = {
+				'volume': n % 5 != 4,
+				'channels': (n % 3 == 2) and 1 or 2,
+				'mute': n % 2 == 0,
+				'rec': name in ('Mic', 'Capture', 'Line'),
+			}
+			values[(card, name)] = {'level': [75, 75], 'mute': 0, 'rec': 0}
+			names.append(name)
+		elements[card] = names
+	reset()
+	sys.modules['alsaaudio'] = sys.modules[__name__]
+
+
+def reset():
+	"""Zero the call counters"""
+	calls.clear()
+
+
+def call(name):
+	calls[name] = calls.get(name, 0) + 1
+	if latency:
+		time.sleep(latency)
+
+
+def cards():
+	call('cards')
+	return list(card_names)
+
+
+def mixers(cardindex=-1, device='default'):
+	call('mixers')
+	if cardindex < 0:
+		cardindex = 0
+	try:
+		return list(elements[cardindex])
+	except KeyError:
+		raise ALSAAudioError('No such card')
+
+
+class Mixer:
+	def __init__(self, control='Master', id=0, cardindex=-1):
+		call('open')
+		if cardindex < 0:
+			cardindex = 0
+		self.key = (cardindex, control)
+		if id != 0 or self.key not in elements:
+			raise ALSAAudioError('Unable to find mixer control %s,%i' % (control, id))
+		self.info = elements[self.key]
+		self.values = values[self.key]
+		self.control = control
+		self.id = id
+		self.closed = False
+
+	def cardname(self):
+		return card_names[self.key[0]]
+
+	def mixer(self):
+		return self.control
+
+	def mixerid(self):
+		return self.id
+
+	def volumecap(self):
+		call('volumecap')
+		if self.info['volume']:
+			return ['Volume']
+		return []
+
+	def switchcap(self):
+		call('switchcap')
+		caps = []
+		if self.info['mute']:
+			caps.append('Playback Mute')
+		if self.info['rec']:
+			caps.append('Capture Mute')
+		return caps
+
+	def getrange(self, direction=PCM_PLAYBACK):
+		call('getrange')
+		return (0, 31)
+
+	def getvolume(self, direction=PCM_PLAYBACK):
+		call('getvolume')
+		if not self.info['volume']:
+			return []
+		return self.values['level'][:self.info['channels']]
+
+	def setvolume(self, volume, channel=None, direction=PCM_PLAYBACK):
+		call('setvolume')
+		if channel is None:
+			channel = 0
+		if channel >= self.info['channels']:
+			raise ALSAAudioError('Invalid channel number')
+		self.values['level'][channel] = int(volume)
+
+	def getmute(self):
+		call('getmute')
+		if not self.info['mute']:
+			raise ALSAAudioError('Mixer has no mute switch')
+		return [self.values['mute']] * self.info['channels']
+
+	def setmute(self, mute, channel=None):
+		call('setmute')
+		if not self.info['mute']:
+			raise ALSAAudioError('Mixer has no mute switch')
+		self.values['mute'] = int(bool(mute))
+
+	def getrec(self):
+		call('getrec')
+		if not self.info['rec']:
+			raise ALSAAudioError('Mixer has no record switch')
+		return [self.values['rec']] * self.info['channels']
+
+	def setrec(self, rec, channel=None):
+		call('setrec')
+		if not self.info['rec']:
+			raise ALSAAudioError('Mixer has no record switch')
+		self.values['rec'] = int(bool(rec))
+
+	def polldescriptors(self):
+		return []
+
+	def handleevents(self):
+		call('handleevents')
+		return 0
+
+	def close(self):
+		self.closed = True
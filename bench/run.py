@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+	run.py (benchmarks for the Volume hot paths)
+
+	Runs the card discovery, the Options dialogs, the Mixer window and
+	the applet of Volume against the simulated sound cards of fakealsa.py
+	and reports, for each scenario, the operations per second and the
+	number of simulated ioctls.  The dialogs, the window and the applet
+	are the real ones, with their worker thread and write scheduler, so
+	they need ROX-Lib, GTK and a display (xvfb-run will do); without them
+	only the discovery scenarios run.  No sound hardware is needed.
+
+	    python bench/run.py --cards 4 --elements 40 --latency 0.2
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, sys, time, tempfile, shutil
+from optparse import OptionParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, APP_DIR)
+
+import fakealsa
+
+
+def setup(options):
+	"""
+	Install the fake cards and keep the Options, presets, topology cache
+	and sockets in a temp dir
+	"""
+	fakealsa.install(options.cards, options.elements, options.latency / 1000.0)
+	os.environ['XDG_CONFIG_HOME'] = os.path.join(options.tmpdir, 'config')
+	os.environ['XDG_RUNTIME_DIR'] = options.tmpdir
+
+	import topology
+	topology.fingerprint = lambda: repr(fakealsa.card_names)
+	topology.topology.path = os.path.join(options.tmpdir, 'Topology')
+
+
+def load_gtk():
+	"""
+	Import ROX-Lib and GTK as AppRun does, for the scenarios that drive
+	the Options dialog and the Mixer window.  Returns False if they are
+	missing or there is no display.
+	"""
+	try:
+		import findrox; findrox.version(2, 0, 0)
+		import rox, gtk
+	except (Exception, SystemExit):
+		return False
+	if gtk.gdk.display_get_default() is None:
+		return False
+	rox.app_dir = APP_DIR
+	import __builtin__
+	__builtin__._ = rox.i18n.translation(os.path.join(APP_DIR, 'Messages'))
+	return True
+
+
+class Timer:
+	"""
+	Times the measured part of a scenario and counts its simulated calls.
+	run() starts it; a scenario with setup of its own starts it again when
+	that is done, and stops it before tearing down.
+	"""
+	def start(self):
+		fakealsa.reset()
+		self.started = time.time()
+		self.running = True
+
+	def stop(self):
+		self.elapsed = time.time() - self.started
+		self.calls = dict(fakealsa.calls)
+		self.running = False
+
+
+def fresh_state():
+	"""Forget everything cached in memory, as a new process would"""
+	import topology
+	from mixerpool import pool
+	pool.close(force=True)
+	topology.topology.cards = None
+
+
+def settle(window):
+	"""
+	Let the writes, worker jobs and their callbacks of a window (or of
+	the applet) finish
+	"""
+	import gtk
+	while True:
+		window.writes.flush()
+		window.worker.sync()
+		if not gtk.events_pending():
+			return
+		while gtk.events_pending():
+			gtk.main_iteration(False)
+
+
+def new_mixer():
+	"""A Mixer window with the page of its card built and read"""
+	import mixer
+	fresh_state()
+	window = mixer.Mixer()
+	settle(window)
+	return window
+
+
+def new_applet():
+	"""A Volume applet in a socket of our own, with its mixer open"""
+	import gtk, volume
+	fresh_state()
+	host = gtk.Window()
+	socket = gtk.Socket()
+	host.add(socket)
+	socket.realize()
+	applet = volume.Volume(socket.get_id())
+	settle(applet)
+	return host, applet
+
+
+def cold_discovery(options, timer):
+	"""First start: probe every element of every card"""
+	import topology
+	fresh_state()
+	if os.path.exists(topology.topology.path):
+		os.remove(topology.topology.path)
+	topology.topology.probed_cards()
+	return 1
+
+
+def warm_discovery(options, timer):
+	"""Later starts: the topology comes from the cache"""
+	import topology
+	fresh_state()
+	topology.topology.probed_cards()
+	return 1
+
+
+def list_cards(options, timer):
+	"""The card list the applet starts with, before any cache exists"""
+	import topology
+	fresh_state()
+	if os.path.exists(topology.topology.path):
+		os.remove(topology.topology.path)
+	topology.topology.card_names()
+	return 1
+
+
+def open_options(options, timer):
+	"""Build the applet's Options dialog, with its card and channel lists"""
+	import rox
+	from rox import OptionsBox
+	import options as applet_options	# registers the card and channel lists
+	fresh_state()
+	box = OptionsBox.OptionsBox(rox.app_options,
+					os.path.join(APP_DIR, 'Options.xml'))
+	timer.stop()
+	box.destroy()
+	return 1
+
+
+def open_mixer_options(options, timer):
+	"""Build the Mixer's Options dialog, with its list of controls"""
+	import rox
+	from rox import OptionsBox
+	import mixer
+	fresh_state()
+	box = OptionsBox.OptionsBox(rox.app_options,
+					os.path.join(APP_DIR, 'Mixer.xml'))
+	timer.stop()
+	box.destroy()
+	return 1
+
+
+def open_mixer(options, timer):
+	"""Mixer.__init__ until the page of the card is built and read"""
+	window = new_mixer()
+	timer.stop()
+	window.quit()
+	return 1
+
+
+def drag_slider(options, timer):
+	"""Drag the first slider of the Mixer, a volume_changed per step"""
+	import gtk
+	window = new_mixer()
+	page = window.current
+	timer.start()
+	for step in range(options.steps):
+		level = step % 101
+		page.adjust_volume(None, 0, level, level)
+		while gtk.events_pending():
+			gtk.main_iteration(False)
+	settle(window)
+	timer.stop()
+	window.quit()
+	return options.steps
+
+
+def mute_toggle(options, timer):
+	"""Click the mute switch of the first Mixer channel that has one"""
+	import volumecontrol
+	from channelstate import MUTE
+	window = new_mixer()
+	page = window.current
+	model = page.model
+	channel = [index for index in range(len(model))
+					if model.masks[index] & MUTE][0]
+	timer.start()
+	for step in range(options.steps):
+		page.setting_toggled(None, channel, volumecontrol._MUTE,
+						not model.flag(channel, MUTE))
+		settle(window)
+	timer.stop()
+	window.quit()
+	return options.steps
+
+
+def apply_scene(options, timer):
+	"""Apply a scene to every channel of the Mixer, then the same again"""
+	window = new_mixer()
+	scene = {}
+	for n, name in enumerate(window.current.model.names):
+		scene[name] = (n % 2 and 40 or 75, n % 3 == 0, None, None)
+	timer.start()
+	for step in range(options.steps):
+		window.apply_scene(scene)
+		settle(window)
+	timer.stop()
+	window.quit()
+	return options.steps
+
+
+def scroll_applet(options, timer):
+	"""Scroll on the applet, each step fading and refreshing the panel"""
+	import gtk
+	host, applet = new_applet()
+	timer.start()
+	for step in range(options.steps):
+		applet.scroll(step % 20 < 10 and 2 or -2)
+		while gtk.events_pending():
+			gtk.main_iteration(False)
+	while applet.ramps.ramps:
+		# The last fade
+		gtk.main_iteration(True)
+	settle(applet)
+	timer.stop()
+	applet.quit()
+	host.destroy()
+	return options.steps
+
+
+# (name, function, needs GTK)
+SCENARIOS = [
+	('cold discovery', cold_discovery, False),
+	('warm discovery', warm_discovery, False),
+	('list the cards', list_cards, False),
+	('open the options dialog', open_options, True),
+	('open the mixer options', open_mixer_options, True),
+	('open the mixer window', open_mixer, True),
+	('drag a slider', drag_slider, True),
+	('toggle mute', mute_toggle, True),
+	('apply a scene', apply_scene, True),
+	('scroll the applet', scroll_applet, True),
+]
+
+
+def run(name, scenario, options, out):
+	total_ops = 0
+	total_time = 0.0
+	calls = {}
+	timer = Timer()
+	for i in range(options.repeat):
+		timer.start()
+		total_ops += scenario(options, timer)
+		if timer.running:
+			timer.stop()
+		total_time += timer.elapsed
+		for call, count in timer.calls.items():
+			calls[call] = calls.get(call, 0) + count
+	if total_time > 0:
+		rate = total_ops / total_time
+	else:
+		rate = float('inf')
+	ops = total_ops / options.repeat
+	ioctls = sum(calls.values()) / options.repeat
+	detail = ' '.join(['%s=%d' % (call, calls[call] / options.repeat)
+					for call in sorted(calls)])
+	print >>out, '%-26s %6d ops %12.1f ops/s %8d calls  %s' % \
+			(name, ops, rate, ioctls, detail)
+
+
+def main():
+	parser = OptionParser(usage='%prog [options] [scenario...]')
+	parser.add_option('--cards', type='int', default=2,
+		help='number of simulated sound cards')
+	parser.add_option('--elements', type='int', default=20,
+		help='number of mixer elements per card')
+	parser.add_option('--latency', type='float', default=0.0,
+		help='milliseconds added to every simulated ioctl')
+	parser.add_option('--steps', type='int', default=500,
+		help='steps for the slider, mute, scene and scroll scenarios')
+	parser.add_option('--repeat', type='int', default=5,
+		help='number of runs of each scenario')
+	(options, args) = parser.parse_args()
+
+	options.tmpdir = tempfile.mkdtemp(prefix='volume-bench-')
+	try:
+		setup(options)
+		print '%d cards x %d elements, %.2f ms per call, %d runs' % \
+			(options.cards, options.elements, options.latency, options.repeat)
+		have_gtk = None
+		for name, scenario, needs_gtk in SCENARIOS:
+			if args and scenario.__name__ not in args:
+				continue
+			if needs_gtk:
+				if have_gtk is None:
+					have_gtk = load_gtk()
+				if not have_gtk:
+					print '%-26s skipped, needs ROX-Lib, GTK and a display' % name
+					continue
+			run(name, scenario, options, sys.stdout)
+	finally:
+		shutil.rmtree(options.tmpdir, True)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,240 @@
+"""
+	channels.py (a registry of the mixer channels of a sound card)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import alsaaudio
+import mixerpool
+from mixerpool import pool
+from topology import topology
+
+
+def get_level(mixer):
+	"""Return the (left, right) volume of a handle, the same for mono"""
+	mixerpool.sync(mixer)
+	vol = mixer.getvolume()
+	if len(vol) == 1:
+		return (vol[0], vol[0])
+	return (vol[0], vol[1])
+
+
+def set_level(mixer, level, channels=2):
+	"""Set the volume of a handle from a (left, right) tuple"""
+	for i, v in enumerate(level[:channels]):
+		try:
+			mixer.setvolume(int(v), i)
+		except alsaaudio.ALSAAudioError:
+			# No such channel.
+			pass
+
+
+def step_level(level, step):
+	"""Return the level 'step' percent above the louder side, on both sides"""
+	vol = min(max(max(level[0], level[1]) + step, 0), 100)
+	return (vol, vol)
+
+
+def read_hardware(mixer):
+	"""Return the (level, mute) of a mixer handle"""
+	return (get_level(mixer), get_mute(mixer))
+
+
+def write_hardware(mixer, level):
+	"""Set the level of a mixer handle and return what it was set to"""
+	set_level(mixer, level)
+	return get_level(mixer)
+
+
+def get_switch(get):
+	"""Return the first value of a getmute or getrec call, None if missing"""
+	try:
+		return bool(get()[0])
+	except (alsaaudio.ALSAAudioError, IndexError):
+		return None
+
+
+def get_mute(mixer):
+	"""Return the mute switch of a handle, None if it has none"""
+	return get_switch(mixer.getmute)
+
+
+def set_mute(mixer, mute):
+	"""Set the mute switch, raises ALSAAudioError if there is none"""
+	mixer.setmute(int(bool(mute)))
+	return get_mute(mixer)
+
+
+class Channel:
+	"""A volume capable mixer element and its open alsaaudio.Mixer handle"""
+	def __init__(self, index, element, mixer):
+		self.index = index
+		self.element = element
+		self.name = element.name
+		self.id = element.id
+		self.mixer = mixer
+
+	def sync(self):
+		"""Pick up changes made by other programs"""
+		mixerpool.sync(self.mixer)
+
+	def get_level(self):
+		"""Return the (left, right) volume, both the same for mono elements"""
+		return get_level(self.mixer)
+
+	def set_level(self, level):
+		"""Set the volume from a (left, right) tuple"""
+		set_level(self.mixer, level, self.element.channels)
+
+	def read_state(self):
+		"""
+		Return (level, mute, rec), mute and rec are None if the element
+		has no such switch.
+		"""
+		mute = rec = None
+		if self.element.mute:
+			mute = get_mute(self.mixer)
+		if self.element.rec:
+			rec = get_switch(self.mixer.getrec)
+		return (self.get_level(), mute, rec)
+
+
+def read_states(channels):
+	"""Return [(index, (level, mute, rec))] for a list of channels"""
+	return [(ch.index, ch.read_state()) for ch in channels]
+
+
+def apply_setting(ch, setting):
+	"""
+	Bring one channel to a (level, mute, rec) setting, None meaning leave
+	as is, and return its new state.  Only what differs from the state
+	read from the card is written.
+	"""
+	level, mute, rec = setting
+	old_level, old_mute, old_rec = ch.read_state()
+	new_level = old_level
+	if level is not None:
+		if not isinstance(level, (tuple, list)):
+			level = (level, level)
+		wanted = tuple([int(v) for v in level[:2]])
+		count = ch.element.channels
+		if wanted[:count] != old_level[:count]:
+			ch.set_level(wanted)
+			new_level = ch.get_level()
+	if mute is not None and old_mute is not None and bool(mute) != old_mute:
+		try:
+			old_mute = set_mute(ch.mixer, mute)
+		except alsaaudio.ALSAAudioError:
+			pass
+	if rec is not None and old_rec is not None and bool(rec) != old_rec:
+		try:
+			ch.mixer.setrec(int(bool(rec)))
+			old_rec = get_switch(ch.mixer.getrec)
+		except alsaaudio.ALSAAudioError:
+			pass
+	return (new_level, old_mute, old_rec)
+
+
+def apply_scene(registry, scene):
+	"""
+	Set a number of channels at once.  'scene' maps element names to
+	(level, mute, rec, lock) tuples, any of which may be None to leave
+	it alone; lock is not a hardware setting and is ignored here.
+	Returns [(index, (level, mute, rec))] for the channels of the scene
+	that the card has, in channel order.
+	"""
+	states = []
+	for name, setting in scene.items():
+		ch = registry.get(name)
+		if ch is not None:
+			states.append((ch.index, apply_setting(ch, setting[:3])))
+	states.sort()
+	return states
+
+
+class ChannelRegistry:
+	"""
+	The volume capable elements of one sound card.
+
+	The elements of the card come from the topology cache and their mixer
+	handles are kept open, so looking up a channel by its control index (the
+	order used by the Mixer window) or by its element name does not touch
+	the hardware.  The registry is rescanned after set_card() selects another card or after invalidate(),
+	e.g. when follow() learns that its card was removed or moved.
+	"""
+	def __init__(self, card_index=0):
+		self.card_index = card_index
+		self.by_index = []
+		self.by_name = {}
+		self.valid = False
+
+	def set_card(self, card_index):
+		"""Select the sound card to scan"""
+		if card_index != self.card_index:
+			self.invalidate()
+			pool.close(self.card_index)
+			self.card_index = card_index
+
+	def follow(self, changes, card_index):
+		"""
+		Take the CardChanges of topology.update() and the index the card
+		has now.  The card is only rescanned if it went away or moved;
+		returns True if it will be.
+		"""
+		stale = self.card_index in changes.stale
+		if stale:
+			self.invalidate()
+		if card_index != self.card_index:
+			self.set_card(card_index)
+			return True
+		return stale
+
+	def invalidate(self):
+		"""Forget the scanned channels, the next lookup rescans the card"""
+		for channel in self.by_index:
+			pool.release(channel.mixer)
+		self.valid = False
+		self.by_index = []
+		self.by_name = {}
+
+	def scan(self):
+		"""Open every volume capable element of the card"""
+		self.invalidate()
+		card = topology.probed(self.card_index)
+		if card is not None:
+			for element in card.volume_elements():
+				try:
+					mixer = pool.acquire(element.name, element.id,
+										self.card_index)
+				except alsaaudio.ALSAAudioError:
+					continue
+				channel = Channel(len(self.by_index), element, mixer)
+				self.by_index.append(channel)
+				if channel.name not in self.by_name:
+					self.by_name[channel.name] = channel
+		self.valid = True
+
+	def channels(self):
+		"""Return the list of channels in control index order"""
+		if not self.valid:
+			self.scan()
+		return self.by_index
+
+	def get(self, name):
+		"""Return the channel for an element name, or None"""
+		if not self.valid:
+			self.scan()
+		return self.by_name.get(name)
+
+	def __getitem__(self, index):
+		return self.channels()[index]
+
+	def __len__(self):
+		return len(self.channels())
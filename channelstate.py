@@ -0,0 +1,179 @@
+"""
+	channelstate.py (the state of the mixer channels, without widgets)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+from array import array
+from curves import LINEAR, curve_for
+
+#bitmask values, shared with volumecontrol
+STEREO	= 1
+LOCK	= 2
+REC		= 4
+MUTE	= 8
+
+
+class ChannelStore:
+	"""
+	The level and switches of a number of channels in flat arrays indexed
+	by channel, a few bytes per element however many there are.  'masks'
+	holds the bits of what each channel has (STEREO, LOCK, REC, MUTE) and
+	'values' those that are on.  'curves' maps the slider positions of
+	each channel to its levels, see curves.py.
+
+	Nothing here touches GTK or the hardware.  Widgets subscribe() to be
+	told which channels changed; between freeze() and thaw() the changes
+	are collected and told once.
+	"""
+	def __init__(self):
+		self.names = []
+		self.by_name = {}
+		self.left = array('B')
+		self.right = array('B')
+		self.masks = array('B')
+		self.values = array('B')
+		self.curves = []
+		self.subscribers = []
+		self.frozen = 0
+		self.pending = []
+
+	def add(self, name, mask=0, value=0, curve=LINEAR):
+		"""Add a channel and return its index"""
+		index = len(self.names)
+		self.names.append(name)
+		self.by_name.setdefault(name, index)
+		self.left.append(0)
+		self.right.append(0)
+		self.masks.append(mask)
+		self.values.append(value & mask)
+		self.curves.append(curve)
+		return index
+
+	def rename(self, index, name):
+		self.names[index] = name
+		self.by_name = {}
+		for index, name in enumerate(self.names):
+			self.by_name.setdefault(name, index)
+
+	def __len__(self):
+		return len(self.names)
+
+	def index(self, name):
+		"""Return the index of the first channel called 'name', or None"""
+		return self.by_name.get(name)
+
+	def subscribe(self, callback):
+		"""Call 'callback(indices)' with the channels that changed"""
+		self.subscribers.append(callback)
+
+	def unsubscribe(self, callback):
+		self.subscribers.remove(callback)
+
+	def changed(self, indices):
+		if self.frozen:
+			self.pending.extend(indices)
+			return
+		for callback in self.subscribers[:]:
+			callback(indices)
+
+	def freeze(self):
+		"""Hold the change notifications until the matching thaw()"""
+		self.frozen += 1
+
+	def thaw(self):
+		self.frozen -= 1
+		if not self.frozen and self.pending:
+			indices = {}
+			for index in self.pending:
+				indices[index] = True
+			self.pending = []
+			self.changed(sorted(indices))
+
+	def level(self, index):
+		return (self.left[index], self.right[index])
+
+	def set_level(self, index, level):
+		left = max(0, min(int(round(level[0])), 100))
+		right = max(0, min(int(round(level[1])), 100))
+		if (left, right) != self.level(index):
+			self.left[index] = left
+			self.right[index] = right
+			self.changed([index])
+
+	def flag(self, index, bit):
+		return bool(self.values[index] & bit)
+
+	def set_flag(self, index, bit, on):
+		value = self.values[index]
+		if on:
+			value |= bit
+		else:
+			value &= ~bit
+		if value != self.values[index]:
+			self.values[index] = value
+			self.changed([index])
+
+	def state(self, index):
+		"""Return (level, mute, rec) as Channel.read_state() does"""
+		mute = rec = None
+		if self.masks[index] & MUTE:
+			mute = self.flag(index, MUTE)
+		if self.masks[index] & REC:
+			rec = self.flag(index, REC)
+		return (self.level(index), mute, rec)
+
+	def set_state(self, index, state):
+		"""Store a state read with Channel.read_state()"""
+		level, mute, rec = state
+		self.freeze()
+		try:
+			if mute is not None:
+				self.masks[index] |= MUTE
+				self.set_flag(index, MUTE, mute)
+			if rec is not None:
+				self.masks[index] |= REC
+				self.set_flag(index, REC, rec)
+			self.set_level(index, level)
+		finally:
+			self.thaw()
+
+	def set_curves(self, curves):
+		"""Give every channel a new curve, e.g. when the option changes"""
+		self.curves = list(curves)
+		self.changed(range(len(self.names)))
+
+	def names_with(self, bit, on=True):
+		"""Return the names of the channels having 'bit', set or not"""
+		return [name for index, name in enumerate(self.names)
+				if self.masks[index] & bit and self.flag(index, bit) == on]
+
+
+def channel_store(channels, unlocked=(), curve='linear'):
+	"""
+	Return a ChannelStore for a list of channels.Channel, in the same
+	order.  The stereo channels are locked unless named in 'unlocked'.
+	'curve' names the curve of the sliders.
+	"""
+	store = ChannelStore()
+	for ch in channels:
+		element = ch.element
+		mask = 0
+		if element.channels > 1:
+			mask |= STEREO | LOCK
+		if element.mute:
+			mask |= MUTE
+		if element.rec:
+			mask |= REC
+		value = 0
+		if ch.name not in unlocked:
+			value = LOCK
+		store.add(ch.name, mask, value, curve_for(curve, element))
+	return store
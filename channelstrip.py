@@ -0,0 +1,178 @@
+"""
+	channelstrip.py (a scrolled row of volume controls for big mixers)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import gtk
+from channelstate import LOCK, REC, MUTE
+
+# Channels kept bound to a control on each side of the visible ones
+MARGIN = 2
+
+# Room left for the scroll bar below the controls
+SCROLLBAR_HEIGHT = 20
+
+
+class ChannelStrip(gtk.ScrolledWindow):
+	"""
+	A horizontally scrolled row of volume controls, one column per shown
+	channel, that only has widgets for the columns in view.
+
+	Scrolling binds the columns coming into view to controls taken from
+	those that went out of it; a control is only recycled for a channel
+	with the same option mask, since that decides which widgets it has.
+	'create(option_mask)' makes a new VolumeControl when there is none
+	to recycle.  The controls follow the changes of 'model', a
+	channelstate.ChannelStore.
+	"""
+	def __init__(self, model, create):
+		gtk.ScrolledWindow.__init__(self)
+		self.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_NEVER)
+		self.model = model
+		self.create = create
+		self.positions = []
+		self.bound = {}
+		self.spare = {}
+		# The x of each control in the layout, every move() queues a resize
+		self.placed = {}
+		self.width = None
+		self.column = 0
+		self.height = 0
+		self.grown = False
+
+		model.subscribe(self.channels_changed)
+
+		self.layout = gtk.Layout()
+		self.add(self.layout)
+		self.layout.show()
+		self.get_hadjustment().connect('value-changed',
+							lambda adj: self.update())
+		self.connect('size-allocate', self.allocated)
+
+	def allocated(self, widget, rect):
+		"""Bind the controls again when the width in view changed"""
+		if rect.width != self.width:
+			self.width = rect.width
+			self.update()
+
+	def set_positions(self, channels):
+		"""Show the channels with the given indices, in that order"""
+		self.positions = list(channels)
+		self.resize_layout()
+		self.update()
+
+	def update(self):
+		"""Bind the channels in view (and MARGIN more) to controls"""
+		if self.positions and not self.column:
+			# Measure a first control to know the column width
+			self.bind(self.positions[0])
+		wanted = {}
+		if self.column:
+			adj = self.get_hadjustment()
+			first = max(int(adj.value) // self.column - MARGIN, 0)
+			last = int(adj.value + max(adj.page_size, self.column)) // \
+						self.column + MARGIN
+			for pos in range(first, min(last + 1, len(self.positions))):
+				wanted[self.positions[pos]] = pos
+
+		for index in self.bound.keys():
+			if index not in wanted:
+				self.unbind(index)
+		for index, pos in wanted.items():
+			control = self.bound.get(index)
+			if control is None:
+				control = self.bind(index)
+			width = control.size_request()[0]
+			x = pos * self.column + (self.column - width) // 2
+			if self.placed[control] != x:
+				self.layout.move(control, x, 0)
+				self.placed[control] = x
+
+		if self.grown:
+			self.grown = False
+			self.resize_layout()
+			self.update()
+
+	def bind(self, index):
+		model = self.model
+		mask = model.masks[index]
+		spare = self.spare.get(mask)
+		if spare:
+			control = spare.pop()
+		else:
+			control = self.create(mask)
+			self.layout.put(control, 0, 0)
+			self.placed[control] = 0
+		control.bind(index, model.names[index], model.values[index],
+						model.level(index), model.curves[index])
+		control.show()
+		self.bound[index] = control
+
+		width, height = control.size_request()
+		if width > self.column or height > self.height:
+			self.column = max(self.column, width)
+			self.height = max(self.height, height)
+			self.grown = True
+		return control
+
+	def unbind(self, index):
+		control = self.bound.pop(index)
+		control.hide()
+		self.spare.setdefault(control.option_mask, []).append(control)
+
+	def channels_changed(self, indices):
+		"""Show the changes of the model in the controls in view"""
+		model = self.model
+		for index in indices:
+			control = self.bound.get(index)
+			if control is None:
+				continue
+			if control.option_mask != model.masks[index]:
+				# The channel turned out to have other switches
+				self.unbind(index)
+				self.update()
+			else:
+				self.refresh(control, index)
+
+	def refresh(self, control, index):
+		"""
+		Push the values of a channel to the control it is bound to.  The
+		label is left alone, GTK rebuilds it on every set_label().
+		"""
+		model = self.model
+		value = model.values[index]
+		control.set_lock(value & LOCK)
+		control.set_mute(value & MUTE)
+		control.set_recsrc(value & REC)
+		level = model.level(index)
+		if model.curves[index] is not control.curve:
+			control.set_curve(model.curves[index])
+			control.set_level(level)
+		elif control.get_level() != level:
+			control.set_level(level)
+
+	def resize_layout(self):
+		self.layout.set_size(max(len(self.positions) * self.column, 1),
+							max(self.height, 1))
+		self.layout.set_size_request(-1, self.height)
+
+	def controls(self):
+		"""Return every control, bound or spare"""
+		controls = self.bound.values()
+		for spare in self.spare.values():
+			controls.extend(spare)
+		return controls
+
+	def natural_size(self):
+		"""The window size showing every column, up to the screen width"""
+		width = min(len(self.positions) * self.column,
+					gtk.gdk.screen_width() * 3 / 4)
+		return (max(width, 1), self.height + SCROLLBAR_HEIGHT)
@@ -0,0 +1,134 @@
+"""
+	curves.py (slider positions to hardware levels)
+
+	alsaaudio levels are percentages of an element's raw range, and most
+	elements step their raw range in even dB.  On an element going down to
+	-100dB a linear slider is silent for most of its travel and does all its
+	work near the top.  A curve maps a slider position (0-100) to a level
+	(0-100) and back:
+
+	  linear   the level is the slider position, as before
+	  cubic    the level is the cube of the position, for elements whose
+	           raw range is linear in amplitude
+	  db       the position is the cube root of the amplitude, taken from
+	           the dB range of the element (as alsamixer does); elements
+	           without dB information, or with a range of at most 24dB,
+	           stay linear
+
+	The tables of a curve are made once per curve and dB range, so moving
+	a slider or scrolling is a list lookup.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import math
+
+CURVES = ('linear', 'cubic', 'db')
+
+# A range of up to this many dB is fine on a linear slider
+MAX_LINEAR_DB = 24.0
+
+
+def clamp(value):
+	return min(max(int(round(value)), 0), 100)
+
+
+class Curve:
+	"""
+	Lookup tables between slider positions and hardware levels, made
+	from 'forward' (position to level) and 'inverse', both on 0.0-1.0.
+	"""
+	def __init__(self, name, forward, inverse):
+		self.name = name
+		self.to_hardware = [clamp(100 * forward(p / 100.0)) for p in range(101)]
+		self.to_slider = [clamp(100 * inverse(v / 100.0)) for v in range(101)]
+
+	def hardware(self, position):
+		"""Return the level of a slider position"""
+		return self.to_hardware[clamp(position)]
+
+	def position(self, level, current=None):
+		"""
+		Return the slider position of a level.  A slider at 'current' is
+		left there if that gives the level, so a slider is not moved by
+		the level it just wrote coming back.
+		"""
+		if current is not None and self.hardware(current) == clamp(level):
+			return current
+		return self.to_slider[clamp(level)]
+
+	def step(self, level, step):
+		"""
+		Return the (left, right) level 'step' slider positions above the
+		louder side, on both sides.  It changes by at least one percent
+		unless it is at the end, or 'step' is 0.
+		"""
+		if not step:
+			return (level[0], level[1])
+		old = clamp(max(level[0], level[1]))
+		position = self.to_slider[old]
+		while True:
+			position = min(max(position + step, 0), 100)
+			vol = self.to_hardware[position]
+			if vol != old or position in (0, 100):
+				return (vol, vol)
+
+
+def linear_curve():
+	identity = lambda x: x
+	return Curve('linear', identity, identity)
+
+
+def cubic_curve():
+	return Curve('cubic', lambda x: x ** 3, lambda x: x ** (1 / 3.0))
+
+
+def db_curve(db_range):
+	low, high = db_range
+	span = float(high - low)
+	floor = math.pow(10, -span / 60)
+	def forward(position):
+		amplitude = floor + position * (1 - floor)
+		return 1 + 60 * math.log10(amplitude) / span
+	def inverse(level):
+		return (math.pow(10, (level - 1) * span / 60) - floor) / (1 - floor)
+	return Curve('db', forward, inverse)
+
+
+curves = {}
+
+def curve_for(name, element=None):
+	"""
+	Return the Curve 'name' for a topology Element, falling back to the
+	linear one where the curve does not apply.
+	"""
+	db_range = None
+	if name == 'db':
+		if element is not None and element.db_range and \
+				element.db_range[1] - element.db_range[0] > MAX_LINEAR_DB:
+			db_range = element.db_range
+		else:
+			name = 'linear'
+	elif name != 'cubic':
+		name = 'linear'
+	key = (name, db_range)
+	curve = curves.get(key)
+	if curve is None:
+		if name == 'db':
+			curve = db_curve(db_range)
+		elif name == 'cubic':
+			curve = cubic_curve()
+		else:
+			curve = linear_curve()
+		curves[key] = curve
+	return curve
+
+
+LINEAR = curve_for('linear')
@@ -0,0 +1,283 @@
+"""
+	headless.py (volume control from the command line, without GTK)
+
+	AppRun --get, --set N, --step [+-]N and --toggle-mute act on the
+	channel the applet controls, taken from the saved Options file
+	without loading ROX-Lib or GTK.
+
+	AppRun --daemon stays in the foreground with the mixer open and
+	answers the same commands on a UNIX socket.  While it runs the
+	commands above are passed to it, which saves starting Python and
+	opening the mixer every time.  AppRun --stop-daemon ends it.  An open
+	Mixer window, or the applet hosting the shared backend, answers them
+	too.
+
+	A Mixer window listens on a socket of its own, so launching AppRun
+	again only asks it to come to the front (or to open its Options)
+	instead of starting a second Mixer, see forward_launch().
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, sys, signal
+from optparse import OptionParser
+import ipc
+
+DAEMON_SOCKET = 'volume-daemon'
+MIXER_SOCKET = 'volume-mixer'
+APPLET_SOCKET = 'volume-applet'
+OPTIONS_NAME = 'Options'
+
+FLAGS = ('--get', '--set', '--step', '--toggle-mute', '--daemon',
+		'--stop-daemon')
+
+
+def wanted(args):
+	"""Return True if the command line asks for a headless command"""
+	for arg in args:
+		if arg.split('=', 1)[0] in FLAGS:
+			return True
+	return False
+
+
+def send(name, line):
+	"""
+	Send a request to socket 'name', None if nothing listens there.  Once
+	the request went out the command may have run, so a late or missing
+	answer is an error rather than a reason to run it elsewhere.
+	"""
+	try:
+		path = ipc.socket_path(name)
+	except (OSError, IOError):
+		return None
+	try:
+		answer = ipc.request(path, line)
+	except (OSError, IOError), e:
+		return 'error: no answer from %s: %s' % (name, e)
+	if answer == '':
+		return 'error: no answer from %s' % name
+	return answer
+
+
+def launch_command(args):
+	"""
+	Return the request a running Mixer gets for an AppRun command line,
+	or None if the command line must be run here.
+	"""
+	for flag in ('-h', '--help', '--load-preset', '--save-preset'):
+		if flag in args:
+			return None
+	for arg in args:
+		if arg.startswith('--load-preset=') or arg.startswith('--save-preset='):
+			return None
+	if '--mixer-options' in args:
+		return 'options'
+	if '--volume-options' in args:
+		return 'volume-options'
+	return 'show'
+
+
+def forward_launch(args):
+	"""Pass an AppRun launch to a running Mixer, True if it took it"""
+	line = launch_command(args)
+	return line is not None and send(MIXER_SOCKET, line) == 'ok'
+
+
+def read_options(path):
+	"""Return the options saved by ROX-Lib as a dictionary of strings"""
+	from xml.dom import minidom
+	from xml.parsers.expat import ExpatError
+	try:
+		doc = minidom.parse(path)
+	except (IOError, ExpatError):
+		return {}
+	values = {}
+	for node in doc.getElementsByTagName('Option'):
+		values[node.getAttribute('name')] = ''.join([child.data
+				for child in node.childNodes
+				if child.nodeType == child.TEXT_NODE])
+	return values
+
+
+class Control:
+	"""
+	The channel of the applet, as chosen in the Options.  The options are
+	read again when the file changes, so a daemon follows a new choice.
+	"""
+	def __init__(self, path=None):
+		if path is None:
+			from topology import config_dir
+			path = os.path.join(config_dir(), OPTIONS_NAME)
+		self.path = path
+		self.mtime = None
+		self.mixer = None
+
+	def open(self):
+		"""Return the mixer handle, raises ALSAAudioError on failure"""
+		from topology import topology
+		from mixerpool import pool
+		try:
+			mtime = os.stat(self.path).st_mtime
+		except OSError:
+			mtime = None
+		if self.mixer is not None and mtime == self.mtime:
+			return self.mixer
+		self.mtime = mtime
+
+		# The same defaults as options.resolve_defaults()
+		options = read_options(self.path)
+		card_name = options.get('mixer_device')
+		control = options.get('mixer_channels')
+		if not card_name or not control:
+			default_card, default_control = topology.default_control(card_name)
+			card_name = card_name or default_card
+			control = control or default_control
+		try:
+			card_index = topology.card_names().index(card_name)
+		except ValueError:
+			card_index = 0
+
+		if self.mixer is not None:
+			pool.release(self.mixer)
+			self.mixer = None
+		self.mixer = pool.acquire(control, 0, card_index)
+		return self.mixer
+
+	def get(self):
+		"""Return (level, mute)"""
+		import channels
+		return channels.read_hardware(self.open())
+
+	def set(self, percent):
+		import channels
+		channels.write_hardware(self.open(), (percent, percent))
+
+	def step(self, step):
+		import channels
+		mixer = self.open()
+		channels.write_hardware(mixer,
+					channels.step_level(channels.get_level(mixer), step))
+
+	def toggle_mute(self):
+		import channels
+		mixer = self.open()
+		channels.set_mute(mixer, not channels.get_mute(mixer))
+
+
+def describe(state):
+	"""The answer to a command: 'LEFT RIGHT muted|unmuted'"""
+	(left, right), mute = state
+	if mute:
+		return '%d %d muted' % (left, right)
+	return '%d %d unmuted' % (left, right)
+
+
+def execute(control, line):
+	"""
+	Run a command line ('get', 'set N', 'step N' or 'toggle-mute') and
+	return the answer, which starts with 'error:' if it failed.
+	"""
+	import alsaaudio
+	words = line.split()
+	if not words:
+		return 'error: no command'
+	command = words[0]
+	try:
+		if command == 'set':
+			control.set(min(max(int(words[1]), 0), 100))
+		elif command == 'step':
+			control.step(int(words[1]))
+		elif command == 'toggle-mute':
+			control.toggle_mute()
+		elif command != 'get':
+			return 'error: unknown command %s' % command
+		return describe(control.get())
+	except (IndexError, ValueError):
+		return 'error: %s needs a number' % command
+	except alsaaudio.ALSAAudioError, e:
+		return 'error: %s' % e
+
+
+def daemon(control):
+	"""Answer commands on the daemon socket until told to stop"""
+	path = ipc.socket_path(DAEMON_SOCKET)
+	server = ipc.listen(path)
+	if server is None:
+		print >>sys.stderr, 'Volume: the daemon is already running'
+		return 1
+
+	def stop(signum, frame):
+		sys.exit(0)
+	signal.signal(signal.SIGTERM, stop)
+
+	class state:
+		running = True
+	def handle(line):
+		if line.strip() == 'stop':
+			state.running = False
+			return 'stopped'
+		return execute(control, line)
+	try:
+		while state.running:
+			ipc.answer(server, handle)
+	finally:
+		ipc.close(server, path)
+	return 0
+
+
+def main(args):
+	"""Run the headless command line, returns the exit status"""
+	parser = OptionParser(usage='%prog --get | --set N | --step [+-]N | '
+			'--toggle-mute | --daemon | --stop-daemon')
+	parser.add_option('--get', action='store_const', const='get',
+		dest='command', help='print the volume and the mute state')
+	parser.add_option('--set', type='int', metavar='N',
+		help='set the volume to N percent')
+	parser.add_option('--step', type='int', metavar='[+-]N',
+		help='change the volume by N percent')
+	parser.add_option('--toggle-mute', action='store_const',
+		const='toggle-mute', dest='command', help='mute or unmute')
+	parser.add_option('--daemon', action='store_true', default=False,
+		help='answer the commands above on a socket until stopped')
+	parser.add_option('--stop-daemon', action='store_true', default=False,
+		help='stop a running daemon')
+	parser.add_option('--no-daemon', action='store_true', default=False,
+		help='do not pass the command to a running daemon')
+	(options, rest) = parser.parse_args(args)
+
+	if options.daemon:
+		return daemon(Control())
+
+	if options.stop_daemon:
+		line = 'stop'
+	elif options.set is not None:
+		line = 'set %d' % options.set
+	elif options.step is not None:
+		line = 'step %d' % options.step
+	else:
+		line = options.command or 'get'
+
+	answer = None
+	if not options.no_daemon:
+		answer = send(DAEMON_SOCKET, line)
+		if not options.stop_daemon:
+			for name in (APPLET_SOCKET, MIXER_SOCKET):
+				if answer is None:
+					answer = send(name, line)
+	if answer is None:
+		if options.stop_daemon:
+			print >>sys.stderr, 'Volume: the daemon is not running'
+			return 1
+		answer = execute(Control(), line)
+	if answer.startswith('error:'):
+		print >>sys.stderr, 'Volume: %s' % answer[6:].strip()
+		return 1
+	print answer
+	return 0
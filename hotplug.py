@@ -0,0 +1,182 @@
+"""
+	hotplug.py (notice sound cards being plugged in or removed)
+
+	Every sound card has a control device node, /dev/snd/controlC<n>,
+	which appears and disappears with the card.  The directory is watched
+	with inotify (through ctypes, Linux only) from the GLib main loop, so
+	nothing runs until a node changes.  Where inotify is not available the
+	fingerprint of the sound hardware is polled instead.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, struct, errno
+import gobject
+from topology import fingerprint
+
+SND_DIR = '/dev/snd'
+CONTROL_PREFIX = 'controlC'
+
+# udev adds the nodes of a card one after the other and sets their
+# permissions afterwards; wait this many milliseconds for it to finish
+SETTLE_DELAY = 1000
+
+# Milliseconds between two looks at the hardware without inotify
+POLL_INTERVAL = 3000
+
+# Milliseconds before the cards that did not answer are probed again
+RETRY_DELAY = 10000
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def inotify_watch(path, mask):
+	"""Return a non-blocking inotify descriptor watching 'path', or None"""
+	try:
+		import ctypes, ctypes.util
+		libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+								use_errno=True)
+		fd = libc.inotify_init()
+	except (ImportError, OSError, AttributeError):
+		return None
+	if fd < 0:
+		return None
+	if libc.inotify_add_watch(fd, path, mask) < 0:
+		os.close(fd)
+		return None
+	import fcntl
+	fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+	return fd
+
+
+def read_events(fd):
+	"""Return the pending inotify events as a list of (mask, name)"""
+	data = ''
+	while True:
+		try:
+			chunk = os.read(fd, 4096)
+		except OSError, e:
+			if e.errno in (errno.EAGAIN, errno.EINTR):
+				break
+			raise
+		if not chunk:
+			break
+		data += chunk
+	events = []
+	offset = 0
+	while offset + EVENT_HEADER.size <= len(data):
+		wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+		offset += EVENT_HEADER.size
+		events.append((mask, data[offset:offset + length].rstrip('\0')))
+		offset += length
+	return events
+
+
+class CardWatch:
+	"""
+	Call 'callback()' from the main loop after the sound cards changed.
+
+	A burst of node changes (a card has several) gives one callback, once
+	they have settled.  The callback only means that something changed;
+	topology.update() finds out what.  retry() asks for a callback later
+	without a change, to probe the cards that were unavailable again.
+	"""
+	def __init__(self, callback):
+		self.callback = callback
+		self.fd = None
+		self.source = None
+		self.settle = None
+		self.retry_source = None
+		self.fingerprint = None
+
+	def start(self):
+		if self.source is None and not self.watch_dir():
+			self.poll_hardware()
+
+	def watch_dir(self):
+		"""Watch /dev/snd with inotify, returns False if that is not possible"""
+		self.fd = inotify_watch(SND_DIR, WATCH_MASK)
+		if self.fd is None:
+			return False
+		self.source = gobject.io_add_watch(self.fd,
+						gobject.IO_IN | gobject.IO_ERR | gobject.IO_HUP,
+						self.readable)
+		return True
+
+	def poll_hardware(self):
+		self.fingerprint = fingerprint()
+		self.source = gobject.timeout_add(POLL_INTERVAL, self.poll)
+
+	def stop(self):
+		for source in (self.source, self.settle, self.retry_source):
+			if source is not None:
+				gobject.source_remove(source)
+		self.source = self.settle = self.retry_source = None
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+	def readable(self, fd, condition):
+		try:
+			events = read_events(fd)
+		except OSError:
+			events = [(IN_IGNORED, '')]
+		for mask, name in events:
+			if mask & IN_IGNORED:
+				# /dev/snd itself went away, poll until it is back.
+				os.close(self.fd)
+				self.fd = None
+				self.poll_hardware()
+				self.changed()
+				return False
+			if mask & IN_Q_OVERFLOW or name.startswith(CONTROL_PREFIX):
+				self.changed()
+		return True
+
+	def poll(self):
+		current = fingerprint()
+		if current != self.fingerprint:
+			self.fingerprint = current
+			self.changed()
+			# Back to inotify if it was only missing the directory
+			if os.path.isdir(SND_DIR) and self.watch_dir():
+				return False
+		return True
+
+	def changed(self):
+		"""Call back once the changes stop coming"""
+		if self.settle is not None:
+			gobject.source_remove(self.settle)
+		self.settle = gobject.timeout_add(SETTLE_DELAY, self.settled)
+
+	def settled(self):
+		self.settle = None
+		self.callback()
+		return False
+
+	def retry(self):
+		"""Call back in RETRY_DELAY, unless a call back is already due"""
+		if self.retry_source is None:
+			self.retry_source = gobject.timeout_add(RETRY_DELAY, self.retried)
+
+	def retried(self):
+		self.retry_source = None
+		self.callback()
+		return False
@@ -0,0 +1,96 @@
+"""
+	iconcache.py (panel icons rendered at the size they are shown)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os
+import gtk, gobject
+import instrument
+
+#icon levels
+MUTED	= 0
+LOW		= 1
+MEDIUM	= 2
+HIGH	= 3
+
+ICON_NAMES = (
+	'audio-volume-muted', 'audio-volume-low',
+	'audio-volume-medium', 'audio-volume-high'
+)
+
+
+def icon_level(vol, mute):
+	"""Return the icon level for a volume (0-100) and mute state"""
+	if (vol <= 0) or mute:
+		return MUTED
+	elif vol >= 66:
+		return HIGH
+	elif vol >= 33:
+		return MEDIUM
+	return LOW
+
+
+class IconCache:
+	"""
+	A least recently used cache of volume icons keyed by (theme, level, size).
+
+	Theme icons are loaded and SVG files rasterized directly at the wanted
+	size, so an icon is never scaled up from a small bitmap, and a given
+	icon is only rendered once while it stays in the cache.  Theme
+	'gtk-theme' means the current GTK icon theme, anything else is one of
+	the private themes in 'themes_dir'.
+	"""
+	def __init__(self, themes_dir, max_entries=16):
+		self.themes_dir = themes_dir
+		self.max_entries = max_entries
+		self.entries = {}
+		self.order = []
+
+	def get(self, theme, level, size):
+		"""Return the pixbuf for an icon level at 'size' pixels"""
+		key = (theme, level, size)
+		pixbuf = self.entries.get(key)
+		if pixbuf is not None:
+			self.order.remove(key)
+			self.order.append(key)
+			return pixbuf
+
+		start = instrument.clock()
+		pixbuf = self.render(theme, ICON_NAMES[level], max(size, 1))
+		instrument.phase('icon loading', start)
+
+		self.entries[key] = pixbuf
+		self.order.append(key)
+		while len(self.order) > self.max_entries:
+			del self.entries[self.order.pop(0)]
+		return pixbuf
+
+	def render(self, theme, name, size):
+		if theme == 'gtk-theme':
+			try:
+				pixbuf = gtk.icon_theme_get_default().load_icon(name, size, 0)
+			except gobject.GError:
+				theme = 'GnomeSVG'
+			else:
+				# The theme may only have a bitmap of another size.
+				if pixbuf.get_width() != size or pixbuf.get_height() != size:
+					pixbuf = pixbuf.scale_simple(size, size,
+										gtk.gdk.INTERP_BILINEAR)
+				return pixbuf
+		path = os.path.join(self.themes_dir, theme, '%s.svg' % name)
+		return gtk.gdk.pixbuf_new_from_file_at_size(path, size, size)
+
+	def clear(self, theme=None):
+		"""Forget the icons of one theme, or of all themes"""
+		for key in self.order[:]:
+			if theme is None or key[0] == theme:
+				self.order.remove(key)
+				del self.entries[key]
@@ -0,0 +1,175 @@
+"""
+	instrument.py (timing reports for Volume)
+
+	Set VOLUME_TIMING=1 in the environment to have the time spent in each
+	startup phase (hardware discovery, GTK import, icon loading...) printed
+	on stderr once the applet or the mixer is up.
+
+	Set VOLUME_STATS=1 (or turn on the statistics in the Options) to count
+	and time every mixer call and UI update.  The statistics are shown by
+	the Statistics menu item, or written to a file on SIGUSR1.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, sys, time, signal, threading
+
+clock = time.time
+
+enabled = bool(os.environ.get('VOLUME_TIMING'))
+started = clock()
+
+phases = []
+phase_times = {}
+
+stats = bool(os.environ.get('VOLUME_STATS'))
+operations = []
+operation_stats = {}
+# Calls are recorded from the main thread and the IOWorker.  Reentrant,
+# as the SIGUSR1 dump may interrupt a record() on the main thread.
+stats_lock = threading.RLock()
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1)
+BUCKET_LABELS = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '>=100ms')
+
+
+def phase(name, start):
+	"""Add the time since 'start' (a clock() value) to a startup phase"""
+	if not enabled:
+		return
+	if name not in phase_times:
+		phases.append(name)
+		phase_times[name] = 0.0
+	phase_times[name] += clock() - start
+
+
+def report(out=None):
+	"""Print the startup phases and the total startup time"""
+	if not enabled:
+		return
+	if out is None:
+		out = sys.stderr
+	for name in phases:
+		print >>out, 'Volume startup: %-20s %8.1f ms' % (name, phase_times[name] * 1000)
+	print >>out, 'Volume startup: %-20s %8.1f ms' % ('total', (clock() - started) * 1000)
+
+
+def set_stats(enable):
+	"""Turn the collection of call statistics on or off"""
+	global stats
+	stats = bool(enable)
+	if stats:
+		install_signal()
+
+
+def record(name, seconds):
+	"""Count one call of operation 'name' that took 'seconds'"""
+	bucket = 0
+	while bucket < len(BUCKETS) and seconds >= BUCKETS[bucket]:
+		bucket += 1
+	stats_lock.acquire()
+	try:
+		entry = operation_stats.get(name)
+		if entry is None:
+			operations.append(name)
+			entry = operation_stats[name] = \
+					[0, 0.0, 0.0, [0] * (len(BUCKETS) + 1)]
+		entry[0] += 1
+		entry[1] += seconds
+		if seconds > entry[2]:
+			entry[2] = seconds
+		entry[3][bucket] += 1
+	finally:
+		stats_lock.release()
+
+
+def timed(name):
+	"""Decorator counting and timing the calls of a function as 'name'"""
+	def decorate(func):
+		def wrapper(*args, **kwargs):
+			if not stats:
+				return func(*args, **kwargs)
+			start = clock()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(name, clock() - start)
+		wrapper.__name__ = func.__name__
+		wrapper.__doc__ = func.__doc__
+		return wrapper
+	return decorate
+
+
+def stats_report():
+	"""Return the call statistics as text"""
+	lines = ['%-20s %8s %10s %9s %9s  %s' % ('operation', 'calls',
+			'total ms', 'mean ms', 'max ms', ' '.join(BUCKET_LABELS))]
+	stats_lock.acquire()
+	try:
+		rows = []
+		for name in operations:
+			count, total, longest, buckets = operation_stats[name]
+			rows.append((name, count, total, longest, list(buckets)))
+	finally:
+		stats_lock.release()
+	for name, count, total, longest, buckets in rows:
+		lines.append('%-20s %8d %10.1f %9.3f %9.3f  %s' % (name, count,
+			total * 1000, total * 1000 / count, longest * 1000,
+			' '.join(['%*d' % (len(label), n)
+					for label, n in zip(BUCKET_LABELS, buckets)])))
+	if not rows:
+		lines.append('(nothing recorded)')
+	return '\n'.join(lines)
+
+
+def dump_path():
+	"""The statistics file, in the private directory of the sockets"""
+	import ipc
+	return os.path.join(ipc.socket_dir(), 'volume-stats-%d.txt' % os.getpid())
+
+
+def dump(signum=None, frame=None):
+	"""Write the call statistics to dump_path()"""
+	try:
+		fd = os.open(dump_path(),
+			os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0600)
+		f = os.fdopen(fd, 'w')
+		try:
+			f.write(stats_report() + '\n')
+		finally:
+			f.close()
+	except (IOError, OSError), e:
+		print >>sys.stderr, 'Volume: failed to write statistics: %s' % e
+
+
+signal_installed = False
+wakeup_source = None
+
+def install_signal():
+	"""Dump the statistics on SIGUSR1 while they are collected"""
+	global signal_installed, wakeup_source
+	if not signal_installed:
+		signal.signal(signal.SIGUSR1, dump)
+		signal_installed = True
+	if wakeup_source is not None:
+		return
+	try:
+		import gobject
+	except ImportError:
+		return
+	# Python only runs signal handlers when it gets control, so wake
+	# up the main loop now and then while statistics are collected.
+	def wakeup():
+		global wakeup_source
+		if not stats:
+			wakeup_source = None
+		return stats
+	wakeup_source = gobject.timeout_add(1000, wakeup)
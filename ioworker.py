@@ -0,0 +1,77 @@
+"""
+	ioworker.py (run mixer calls away from the GTK main loop)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import threading, Queue
+import gobject
+
+# The worker posts its results with gobject.idle_add from its own thread.
+gobject.threads_init()
+
+
+class IOWorker:
+	"""
+	A thread that makes the (possibly slow) mixer calls in order.
+
+	call() queues 'func(*args)' and returns at once.  When the call is
+	done 'callback(result)' is run from the main loop, or 'errback(error)'
+	if it raised an exception.  Once the worker is used, mixer handles
+	must only be touched through it.
+	"""
+	def __init__(self):
+		self.queue = Queue.Queue()
+		self.thread = None
+
+	def start(self):
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run, name='mixer I/O')
+			self.thread.setDaemon(True)
+			self.thread.start()
+
+	def call(self, func, args=(), callback=None, errback=None):
+		"""Queue a call, see the class description"""
+		self.start()
+		self.queue.put((func, args, callback, errback))
+
+	def run(self):
+		while True:
+			job = self.queue.get()
+			try:
+				if job is None:
+					return
+				func, args, callback, errback = job
+				try:
+					result = func(*args)
+				except Exception, e:
+					if errback is not None:
+						gobject.idle_add(self.deliver, errback, e)
+				else:
+					if callback is not None:
+						gobject.idle_add(self.deliver, callback, result)
+			finally:
+				self.queue.task_done()
+
+	def deliver(self, callback, result):
+		callback(result)
+		return False
+
+	def sync(self):
+		"""Wait until every queued call has been made"""
+		if self.thread is not None:
+			self.queue.join()
+
+	def stop(self):
+		"""Make the queued calls and end the thread"""
+		if self.thread is not None:
+			self.queue.put(None)
+			self.thread.join()
+			self.thread = None
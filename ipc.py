@@ -0,0 +1,282 @@
+"""
+	ipc.py (commands over a per-user UNIX socket)
+
+	A request is one line of text and so is the answer.  The socket lives
+	in a directory only the user can enter: $XDG_RUNTIME_DIR if it is
+	set, else a 'volume-UID' directory in the temporary directory.
+
+	A Stream is a connection that stays open, with lines going both ways
+	whenever there is something to say.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, socket, stat, errno, tempfile
+
+# Seconds a client waits for an answer
+TIMEOUT = 5.0
+
+# Longest request or answer line
+MAX_LINE = 4096
+
+
+def socket_dir():
+	"""Return the private directory for the sockets, creating it"""
+	runtime = os.environ.get('XDG_RUNTIME_DIR')
+	if runtime and os.path.isdir(runtime):
+		return runtime
+	dir = os.path.join(tempfile.gettempdir(), 'volume-%d' % os.getuid())
+	try:
+		os.mkdir(dir, 0700)
+	except OSError, e:
+		if e.errno != errno.EEXIST:
+			raise
+	info = os.lstat(dir)
+	if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+			stat.S_IMODE(info.st_mode) & 077:
+		raise OSError(errno.EPERM, 'Unsafe socket directory', dir)
+	return dir
+
+
+def socket_path(name):
+	"""Return the path of socket 'name' (e.g. 'volume-daemon')"""
+	return os.path.join(socket_dir(), '%s.sock' % name)
+
+
+def read_line(sock):
+	"""Read one line from a socket, without the newline"""
+	data = ''
+	while '\n' not in data and len(data) < MAX_LINE:
+		chunk = sock.recv(MAX_LINE)
+		if not chunk:
+			break
+		data += chunk
+	return data.split('\n', 1)[0]
+
+
+def read_lines(sock, count):
+	"""
+	Read 'count' lines from a socket, returns them and what was read
+	after them.  Raises socket.error if the other end closes first.
+	"""
+	data = ''
+	while data.count('\n') < count and len(data) < MAX_LINE * count:
+		chunk = sock.recv(MAX_LINE)
+		if not chunk:
+			break
+		data += chunk
+	lines = data.split('\n', count)
+	if len(lines) <= count:
+		raise socket.error(errno.ECONNRESET, 'Connection closed')
+	return lines[:count], lines[count]
+
+
+def connect(path, timeout=TIMEOUT):
+	"""Return a socket connected to 'path', or None if nothing listens"""
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.settimeout(timeout)
+	try:
+		sock.connect(path)
+	except socket.error:
+		sock.close()
+		return None
+	return sock
+
+
+def request(path, line, timeout=TIMEOUT):
+	"""
+	Send a request line and return the answer line, or None if nothing
+	listens on the socket.
+	"""
+	sock = connect(path, timeout)
+	if sock is None:
+		return None
+	try:
+		sock.sendall(line + '\n')
+		return read_line(sock)
+	finally:
+		sock.close()
+
+
+def listen(path):
+	"""
+	Return a socket listening on 'path', or None if another process is
+	listening there already.  A socket left behind by a dead process is
+	replaced.
+	"""
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.bind(path)
+	except socket.error, e:
+		if e.args[0] != errno.EADDRINUSE:
+			sock.close()
+			raise
+		probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			try:
+				probe.connect(path)
+			except socket.error:
+				pass
+			else:
+				sock.close()
+				return None
+		finally:
+			probe.close()
+		os.unlink(path)
+		sock.bind(path)
+	sock.listen(5)
+	return sock
+
+
+def read_request(server):
+	"""
+	Accept a connection, returns (connection, request line).  This
+	waits for the line, see accept() for the main loop.
+	"""
+	conn, addr = server.accept()
+	conn.settimeout(TIMEOUT)
+	try:
+		return conn, read_line(conn)
+	except socket.error:
+		return conn, ''
+
+
+def reply(conn, line):
+	"""Send the answer to a request and close the connection"""
+	try:
+		try:
+			conn.sendall(line + '\n')
+		except socket.error:
+			pass
+	finally:
+		conn.close()
+
+
+def answer(server, handler):
+	"""Accept one connection and answer its request with handler(line)"""
+	conn, line = read_request(server)
+	reply(conn, handler(line))
+
+
+def accept(server, handler):
+	"""
+	Accept a connection and read its request line from the gobject main
+	loop, then call 'handler(connection, line)'.  A client that is slow
+	to send its line does not hold up the main loop, and one that sends
+	nothing for TIMEOUT seconds is dropped.
+	"""
+	import gobject
+	try:
+		conn, addr = server.accept()
+	except socket.error:
+		return
+	conn.setblocking(False)
+	parts = []
+	def readable(source, condition):
+		try:
+			chunk = conn.recv(MAX_LINE)
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EINTR):
+				return True
+			chunk = ''
+		parts.append(chunk)
+		data = ''.join(parts)
+		if chunk and '\n' not in data and len(data) < MAX_LINE:
+			return True
+		gobject.source_remove(timer)
+		conn.settimeout(TIMEOUT)
+		handler(conn, data.split('\n', 1)[0])
+		return False
+	def expired():
+		gobject.source_remove(watch)
+		conn.close()
+		return False
+	watch = gobject.io_add_watch(conn,
+				gobject.IO_IN | gobject.IO_ERR | gobject.IO_HUP, readable)
+	timer = gobject.timeout_add(int(TIMEOUT * 1000), expired)
+
+
+def watch(server, handler):
+	"""
+	Answer requests from the gobject main loop.  'handler(line, send)'
+	must call send(answer) once, possibly later.  Returns the source id.
+	"""
+	import gobject
+	def request(conn, line):
+		handler(line, lambda answer: reply(conn, answer))
+	def readable(source, condition):
+		accept(server, request)
+		return True
+	return gobject.io_add_watch(server, gobject.IO_IN, readable)
+
+
+class Stream:
+	"""
+	A connection kept open and read from the gobject main loop.
+	'handler(stream, line)' is called for each line that comes in and
+	'closed(stream)' once, when the other end goes away or close() is
+	called.  'data' is anything read from the socket already.
+	"""
+	def __init__(self, sock, handler, closed, data=''):
+		import gobject
+		self.sock = sock
+		self.handler = handler
+		self.closed = closed
+		self.data = data
+		self.source = gobject.io_add_watch(sock,
+				gobject.IO_IN | gobject.IO_ERR | gobject.IO_HUP, self.readable)
+		if '\n' in data:
+			gobject.idle_add(self.split)
+
+	def readable(self, source, condition):
+		try:
+			chunk = self.sock.recv(MAX_LINE)
+		except socket.error:
+			chunk = ''
+		if not chunk:
+			self.close()
+			return False
+		self.data += chunk
+		self.split()
+		return self.sock is not None
+
+	def split(self):
+		"""Pass on the complete lines read so far"""
+		while self.sock is not None and '\n' in self.data:
+			line, self.data = self.data.split('\n', 1)
+			self.handler(self, line)
+		if len(self.data) > MAX_LINE:
+			self.close()
+		return False
+
+	def send(self, line):
+		if self.sock is None:
+			return
+		try:
+			self.sock.sendall(line + '\n')
+		except socket.error:
+			self.close()
+
+	def close(self):
+		if self.sock is None:
+			return
+		import gobject
+		gobject.source_remove(self.source)
+		self.sock.close()
+		self.sock = None
+		self.closed(self)
+
+
+def close(server, path):
+	server.close()
+	try:
+		os.unlink(path)
+	except OSError:
+		pass
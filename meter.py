@@ -0,0 +1,245 @@
+"""
+	meter.py (the level of the signal the card is playing)
+
+	A level meter reads a capture PCM, e.g. a loopback or monitor device,
+	a period at a time and without blocking, from a main loop timer.  The
+	RMS and peak of each read are measured with NumPy when it is installed
+	and with audioop otherwise.  Both are shown in dB: the RMS falls back at
+	a fixed rate, the peak is held for a while before it falls.  The widget
+	is only told when one of them moved by a step of the bar.
+
+	While nothing is playing on any card (see playing()) the PCM is closed
+	and the meter only looks at /proc once a second.  A stopped meter does
+	nothing at all; the windows stop theirs while they are hidden.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import math, time, glob, audioop
+import gobject
+import alsaaudio
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Default updates per second
+METER_RATE = 20
+
+# Samples per second read from the PCM, plenty for a level
+SAMPLE_RATE = 8000
+
+# The bottom of the meter, and how fast it falls, in dB and dB per second
+FLOOR_DB = -60.0
+DECAY_DB = 20.0
+
+# Seconds the peak is held before it falls
+PEAK_HOLD = 1.5
+
+# Smallest change of the fraction shown that is worth a redraw
+STEP = 0.01
+
+# Milliseconds between two looks for playback while idle, or playing
+IDLE_INTERVAL = 1000
+
+STATUS_FILES = '/proc/asound/card*/pcm*p/sub*/status'
+
+
+def playing():
+	"""Return True if a playback stream is running on any card"""
+	for path in glob.glob(STATUS_FILES):
+		try:
+			f = open(path)
+			try:
+				if 'RUNNING' in f.readline():
+					return True
+			finally:
+				f.close()
+		except IOError:
+			pass
+	return False
+
+
+def measure(data):
+	"""Return the (RMS, peak) level of signed 16 bit samples, 0.0-1.0"""
+	if numpy is not None:
+		samples = numpy.frombuffer(data, numpy.int16).astype(numpy.float32)
+		if not len(samples):
+			return (0.0, 0.0)
+		rms = math.sqrt(float(numpy.dot(samples, samples)) / len(samples))
+		peak = float(numpy.abs(samples).max())
+	else:
+		rms = audioop.rms(data, 2)
+		peak = audioop.max(data, 2)
+	return (min(rms / 32768.0, 1.0), min(peak / 32768.0, 1.0))
+
+
+def to_db(fraction):
+	if fraction <= 0:
+		return FLOOR_DB
+	return max(20 * math.log10(fraction), FLOOR_DB)
+
+
+def draw_peak(bar, peak):
+	"""
+	Mark a peak, 0.0-1.0, across a gtk.ProgressBar showing the level,
+	from the bar's expose-event handler.
+	"""
+	import gtk
+	if not peak or bar.window is None:
+		return
+	x, y, width, height = bar.allocation
+	if not bar.flags() & gtk.NO_WINDOW:
+		x = y = 0
+	gc = bar.style.fg_gc[gtk.STATE_NORMAL]
+	if bar.get_orientation() == gtk.PROGRESS_BOTTOM_TO_TOP:
+		pos = y + height - 1 - int(peak * (height - 1))
+		bar.window.draw_line(gc, x, pos, x + width - 1, pos)
+	else:
+		pos = x + int(peak * (width - 1))
+		bar.window.draw_line(gc, pos, y, pos, y + height - 1)
+
+
+def open_pcm(device, periodsize):
+	"""Open a non-blocking capture PCM, raises ALSAAudioError on failure"""
+	try:
+		pcm = alsaaudio.PCM(alsaaudio.PCM_CAPTURE, alsaaudio.PCM_NONBLOCK,
+								device=device)
+	except TypeError:
+		# pyalsaaudio before 0.8
+		pcm = alsaaudio.PCM(alsaaudio.PCM_CAPTURE, alsaaudio.PCM_NONBLOCK,
+								card=device)
+	try:
+		pcm.setchannels(2)
+		pcm.setrate(SAMPLE_RATE)
+		pcm.setformat(alsaaudio.PCM_FORMAT_S16_LE)
+		pcm.setperiodsize(periodsize)
+	except alsaaudio.ALSAAudioError:
+		pcm.close()
+		raise
+	return pcm
+
+
+class SignalMeter:
+	"""
+	Calls 'callback(fraction, peak)' with the RMS level and the held peak
+	of the signal on 'device', 0.0 at FLOOR_DB to 1.0 at full scale, at
+	most 'rate' times a second and only when they changed.  Nothing runs
+	until start().
+	"""
+	def __init__(self, callback, device='default', rate=METER_RATE):
+		self.callback = callback
+		self.device = device
+		self.rate = max(1, rate)
+		self.pcm = None
+		self.source = None
+		self.level = FLOOR_DB
+		self.peak = FLOOR_DB
+		self.peak_time = 0.0
+		self.shown = None
+		self.last = 0.0
+		self.checked = 0.0
+
+	def start(self):
+		if self.source is None:
+			self.idle()
+
+	def stop(self):
+		if self.source is not None:
+			gobject.source_remove(self.source)
+			self.source = None
+		self.close()
+
+	def running(self):
+		return self.source is not None
+
+	def set_device(self, device, rate):
+		self.device = device
+		self.rate = max(1, rate)
+		if self.running():
+			self.stop()
+			self.start()
+
+	def close(self):
+		if self.pcm is not None:
+			try:
+				self.pcm.close()
+			except (AttributeError, alsaaudio.ALSAAudioError):
+				pass
+			self.pcm = None
+		self.level = self.peak = FLOOR_DB
+		self.show(0.0, 0.0)
+
+	def idle(self):
+		"""Wait for something to play, with the PCM closed"""
+		self.close()
+		if not self.capture():
+			self.source = gobject.timeout_add(IDLE_INTERVAL, self.check)
+
+	def check(self):
+		return not self.capture()
+
+	def capture(self):
+		"""Open the PCM and start reading if something plays"""
+		if not playing():
+			return False
+		try:
+			self.pcm = open_pcm(self.device, SAMPLE_RATE // self.rate)
+		except alsaaudio.ALSAAudioError:
+			# Try again on the next look
+			return False
+		self.last = self.checked = time.time()
+		self.source = gobject.timeout_add(1000 // self.rate, self.tick)
+		return True
+
+	def tick(self):
+		now = time.time()
+		if now - self.checked >= IDLE_INTERVAL / 1000.0:
+			self.checked = now
+			if not playing():
+				self.idle()
+				return False
+		data = ''
+		try:
+			while True:
+				length, chunk = self.pcm.read()
+				if length <= 0:
+					break
+				data += chunk
+		except alsaaudio.ALSAAudioError:
+			self.idle()
+			return False
+
+		# Fall back from the last level, unless the new one is louder
+		elapsed = now - self.last
+		level = self.level - DECAY_DB * elapsed
+		self.last = now
+		rms = peak = FLOOR_DB
+		if data:
+			rms, peak = [to_db(v) for v in measure(data)]
+		self.level = max(level, rms, FLOOR_DB)
+
+		# Hold a new peak, let an old one fall
+		if peak >= self.peak:
+			self.peak = peak
+			self.peak_time = now
+		elif now - self.peak_time > PEAK_HOLD:
+			self.peak = max(self.peak - DECAY_DB * elapsed, self.level)
+		self.show((self.level - FLOOR_DB) / -FLOOR_DB,
+				(self.peak - FLOOR_DB) / -FLOOR_DB)
+		return True
+
+	def show(self, fraction, peak):
+		shown = (fraction, peak)
+		if self.shown is None or (shown == (0.0, 0.0) and self.shown != shown) \
+				or max([abs(a - b) for a, b in zip(shown, self.shown)]) >= STEP:
+			self.shown = shown
+			self.callback(fraction, peak)
@@ -18,14 +18,26 @@
 	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import rox, sys
+import rox, sys, instrument, ipc, headless
 from rox import app_options, Menu, InfoWin, OptionsBox
 from rox.options import Option
 import gtk, gobject, volumecontrol
 from volumecontrol import VolumeControl
+from channelstate import channel_store, LOCK
+from channelstrip import ChannelStrip
+from curves import curve_for
+from channels import ChannelRegistry, read_states, apply_scene
+from mixerpool import pool
+from topology import topology
+from mixerwatch import MixerWatch
+from writescheduler import WriteScheduler
+from ioworker import IOWorker
+from hotplug import CardWatch
+from meter import SignalMeter, draw_peak
 from options import (
-	get_mixer_device, MIXER_DEVICE, SHOW_VALUES, SHOW_CONTROLS, MASK_LOCK,
-	MASK_MUTE
+	get_mixer_device, get_unlocked_channels, set_unlocked_channels,
+	MIXER_DEVICE, SHOW_VALUES, SHOW_CONTROLS, WRITE_RATE, STATS, VOLUME_CURVE,
+	METER, METER_DEVICE, METER_RATE
 )
 
 try:
@@ -37,26 +49,41 @@ APP_NAME = 'MixerX'
 APP_DIR = rox.app_dir
 APP_SIZE = [20, 100]
 
+# Number of channels read per main loop iteration
+BUILD_CHUNK = 8
+
+# Room for the notebook tabs when there is more than one card
+TAB_HEIGHT = 30
+
+# Width of the signal level meter
+METER_WIDTH = 12
+
 #Options.xml processing
 #rox.setup_app_options('Volume', 'Mixer.xml', site='hayber.us')
 #Menu.set_save_name('Volume', site='hayber.us')
 
 
+def scan_channels(registry):
+	"""Open the channels of a registry, returns a list of them"""
+	return list(registry.channels())
+
+def write_level(ch, level):
+	"""Set the level of a channel and return what it was set to"""
+	ch.set_level(level)
+	return ch.get_level()
+
+def update_cards():
+	"""Follow cards plugged in or removed, returns the CardChanges"""
+	changes = topology.update()
+	changes.added = topology.probe(changes.added)
+	return changes
+
 def get_alsa_channels():
-	alsa_channels = []
-	mixer_device = get_mixer_device()
-	for card_index, card in enumerate(alsaaudio.cards()):
-		if card_index != mixer_device:
-			continue
-		for channel in alsaaudio.mixers(card_index):
-			try:
-				mixer = alsaaudio.Mixer(channel, 0, card_index)
-			except alsaaudio.ALSAAudioError:
-				continue
-			if len(mixer.volumecap()):
-				alsa_channels.append((channel, 0))
-				mixer_device_name = card
-	return alsa_channels
+	"""Return (element name, id) for each volume capable channel of the card"""
+	card = topology.probed(get_mixer_device())
+	if card is None:
+		return []
+	return [(element.name, element.id) for element in card.volume_elements()]
 
 
 def build_mixer_controls(box, node, label, option):
@@ -72,17 +99,12 @@ def build_mixer_controls(box, node, label, option):
 	def build():
 		controls.clear()
 
-		n = 0
-		for channel, id in get_alsa_channels():
-			mixer = alsaaudio.Mixer(channel, id, get_mixer_device())
-			if not len(mixer.volumecap()):
-				continue
+		for n, (channel, id) in enumerate(get_alsa_channels()):
 			checkbox = controls[n] = gtk.CheckButton(label=channel)
 			if option.int_value & (1 << n):
 				checkbox.set_active(True)
 			checkbox.connect('toggled', lambda e: box.check_widget(option))
 			vbox.pack_start(checkbox)
-			n += 1
 	box.may_add_tip(frame, node)
 
 	def get_values():
@@ -110,7 +132,7 @@ def build_hidden_value(box, node, label, option):
 	in the Options system without any UI
 	"""
 	widget = gtk.HBox() #something unobtrusive
-	def get_values(): return option.int_value
+	def get_values(): return option.value
 	def set_values(): pass
 	box.handlers[option] = (get_values, set_values)
 	return [widget]
@@ -120,70 +142,353 @@ OptionsBox.widget_registry['hidden_value'] = build_hidden_value
 rox.app_options.notify()
 
 
-class Mixer(rox.Window):
-	"""A sound mixer class"""
-	def __init__(self):
-		rox.Window.__init__(self)
+class CardPage:
+	"""
+	The controls of one sound card, a page of the Mixer notebook.
 
-		self.thing = gtk.HBox()
-		self.add(self.thing)
+	Nothing is read from the card and no control is made until the page
+	is first shown, see activate().  The card is only watched while its
+	page is the current one, and read again when the page comes back.
 
-		# Update things when options change
-		rox.app_options.add_notify(self.get_options)
+	The registry is only used on the worker: it opens the channels there
+	and the page keeps the list it returned in 'channels'.
+	"""
+	def __init__(self, window, card):
+		self.window = window
+		self.card_index = card.index
+		self.card_name = card.name
+		self.registry = ChannelRegistry(card.index)
+		self.channels = None
+		self.scans = 0
+		self.active = False
+		self.model = None
+		self.strip = None
+		self.read = set()
+		self.building = set()
+		self.watched = None
+
+		self.box = gtk.VBox()
+		self.box.show()
+		self.label = gtk.Label(card.name)
+
+	def activate(self):
+		"""The page is shown, build it or catch up with the card"""
+		self.active = True
+		if not self.scans:
+			self.scan()
+		elif self.model is not None:
+			self.hardware_changed(self.watched)
+			self.watch_card()
+
+	def deactivate(self):
+		"""The page is hidden, stop following the card"""
+		self.active = False
+		self.unwatch()
+
+	def unwatch(self):
+		if self.watched is not None:
+			self.window.watch.forget(self.watched)
+			self.watched = None
+
+	def scan(self):
+		"""Open the channels of the card on the worker"""
+		self.scans += 1
+		scans = self.scans
+		self.window.worker.call(scan_channels, (self.registry,),
+			lambda channels: self.scanned(scans, channels))
+
+	def scanned(self, scans, channels):
+		"""
+		Build the page for the channels opened by the worker.  The
+		controls are only rebuilt if the channels are not the same as
+		before.
+		"""
+		if scans != self.scans:
+			# A later scan is on its way
+			return
+		self.channels = channels
+		if self.model is None:
+			self.build()
+		elif [ch.name for ch in channels] != self.model.names:
+			self.model.unsubscribe(self.strip.channels_changed)
+			self.strip.destroy()
+			self.model = None
+			self.build()
+		else:
+			self.show_hide_controls()
+		if self.active:
+			self.watch_card()
+			self.window.fit()
+
+	def build(self):
+		channels = self.channels
+		self.model = channel_store(channels,
+				get_unlocked_channels([ch.name for ch in channels]),
+				VOLUME_CURVE.value)
+		self.strip = ChannelStrip(self.model, self.create_control)
+		self.box.pack_start(self.strip)
+		self.strip.show()
+		# The levels are filled in as the worker reads the channels
+		self.show_hide_controls()
+
+	def follow(self, changes, card_index):
+		"""Take the CardChanges of a hotplug, see ChannelRegistry.follow()"""
+		self.card_index = card_index
+		self.window.worker.call(self.registry.follow, (changes, card_index),
+						self.followed)
+
+	def followed(self, rescan):
+		if rescan and self.scans:
+			self.card_replaced()
+
+	def card_replaced(self):
+		"""Open the channels again after the card moved"""
+		writes = self.window.writes
+		for key in writes.pending.keys():
+			if key[0] == self.card_name:
+				writes.cancel(key)
+		self.read.clear()
+		self.building.clear()
+		self.unwatch()
+		self.scan()
+
+	def watch_card(self):
+		"""Follow changes made to the card by other programs"""
+		self.unwatch()
+		channels = self.channels
+		if channels:
+			self.watched = channels[0].mixer
+			self.window.watch.add(self.watched, self.hardware_changed)
+
+	def shown(self):
+		"""
+		Return the indices of the channels to show: those chosen with
+		SHOW_CONTROLS for the card of the Options, all for other cards.
+		"""
+		channels = self.channels or []
+		if self.card_name != MIXER_DEVICE.value:
+			return [ch.index for ch in channels]
+		return [ch.index for ch in channels
+				if SHOW_CONTROLS.int_value & (1 << ch.index)]
+
+	def read_shown(self):
+		"""
+		Read the shown channels that were not read yet.  The worker reads
+		them BUILD_CHUNK at a time and each chunk is stored from its own
+		main loop callback, so the window stays responsive on big cards.
+		Hidden channels are left until they are shown.
+		"""
+		channels = self.channels
+		todo = [channels[index] for index in self.shown()
+				if index not in self.read and index not in self.building]
+		for start in range(0, len(todo), BUILD_CHUNK):
+			chunk = todo[start:start + BUILD_CHUNK]
+			self.building.update([ch.index for ch in chunk])
+			self.window.worker.call(read_states, (chunk,), self.chunk_read)
+
+	@instrument.timed('mixer build')
+	def chunk_read(self, states):
+		"""Store the first state of a chunk of channels"""
+		for index, state in states:
+			if index not in self.building:
+				# Read before the card was replaced
+				continue
+			self.building.discard(index)
+			self.read.add(index)
+			self.state_read(index, state)
+
+	def create_control(self, option_mask):
+		"""Make a control for the strip to bind to channels"""
+		volume = VolumeControl(0, option_mask, 0, SHOW_VALUES.int_value)
+		volume.connect("volume_changed", self.adjust_volume)
+		volume.connect("volume_setting_toggled", self.setting_toggled)
+		volume.connect("volume_released",
+					lambda *args: self.window.writes.flush())
+		return volume
+
+	@instrument.timed('mixer hw change')
+	def hardware_changed(self, mixer):
+		"""Re-read the card after another program changed it"""
+		if self.channels is None:
+			return
+		self.window.worker.call(read_states,
+					([ch for ch in self.channels if ch.index in self.read],),
+					self.states_read)
+
+	def states_read(self, states):
+		"""Refresh only the controls whose element was changed elsewhere"""
+		pending = self.window.writes.pending
+		for index, state in states:
+			if (self.card_name, index) in pending or index not in self.read:
+				# Don't undo a level the mixer has not seen yet.
+				continue
+			if state != self.model.state(index):
+				self.state_read(index, state)
 
-		self.lock_mask = MASK_LOCK.int_value
+	def setting_toggled(self, vol, channel, button, val):
+		"""Handle checkbox toggles"""
+		ch = self.channels[channel]
+		worker = self.window.worker
 
-		n = 0
-		for channel, id in get_alsa_channels():
-			#if the mixer supports a channel add it
-			mixer = alsaaudio.Mixer(channel, id, get_mixer_device())
-			option_mask = option_value = 0
+		self.model.set_flag(channel, button, val)
 
-			if not len(mixer.volumecap()):
-				continue
+		if button == volumecontrol._MUTE:
+			worker.call(ch.mixer.setmute, (val,))
 
-			if len(mixer.getvolume()) > 1:
-				option_mask |= volumecontrol._STEREO
-				option_mask |= volumecontrol._LOCK
+		if button == volumecontrol._LOCK:
+			self.save_unlocked()
 
-			if self.lock_mask & (1 << n):
-				option_value |= volumecontrol._LOCK
+		if button == volumecontrol._REC:
+			worker.call(ch.mixer.setrec, (val,))
 
-			try:
-				rec = mixer.getrec()
-			except alsaaudio.ALSAAudioError:
-				pass
-			else:
-			    if rec:
-				    option_mask |= volumecontrol._REC
-			    if rec[0]:
-				    option_value |= volumecontrol._REC
-
-			try:
-				mute = mixer.getmute()
-			except alsaaudio.ALSAAudioError:
-			    pass
-			else:
-			    if mute:
-				    option_mask |= volumecontrol._MUTE
-			    if mute[0]:
-				    option_value |= volumecontrol._MUTE
-
-			volume = VolumeControl(n, option_mask, option_value,
-								SHOW_VALUES.int_value, channel)
-			volume.set_level(self.get_volume(n))
-			volume.connect("volume_changed", self.adjust_volume)
-			volume.connect("volume_setting_toggled", self.setting_toggled)
-			self.thing.pack_start(volume)
-			n += 1
-
-		self.thing.show()
-		self.show_hide_controls()
+		worker.call(ch.read_state, (),
+			lambda state: self.state_read(channel, state))
+
+	def save_unlocked(self):
+		"""Store the unlocked channels of the card, keeping the others'"""
+		names = self.model.names
+		others = [name for name in get_unlocked_channels(names)
+				if name not in names]
+		set_unlocked_channels(others + self.model.names_with(LOCK, False))
+
+	def adjust_volume(self, vol, channel, volume1, volume2):
+		"""Track changes to the volume controls"""
+		self.model.set_level(channel, (volume1, volume2))
+		self.window.writes.schedule((self.card_name, channel), self.set_volume,
+						(volume1, volume2), channel)
+
+	@instrument.timed('mixer write')
+	def set_volume(self, volume, channel):
+		"""Queue the playback volume for the mixer"""
+		self.window.worker.call(write_level, (self.channels[channel], volume),
+			lambda level: self.level_written(channel, level))
+
+	def level_written(self, channel, level):
+		"""Remember what the mixer made of a write"""
+		self.model.set_level(channel, level)
+
+	def apply_scene(self, scene):
+		"""
+		Set a number of channels in one pass, see channels.apply_scene()
+		for 'scene'.  Only what differs from the card is written and the
+		controls are refreshed once, when it is done.
+		"""
+		if self.model is None:
+			# Not shown yet, it will read the result when it is
+			self.window.worker.call(apply_scene, (self.registry, scene))
+			return
+		for name in scene:
+			index = self.model.index(name)
+			if index is not None:
+				# The scene wins over a level still waiting to be written
+				self.window.writes.cancel((self.card_name, index))
+		self.window.worker.call(apply_scene, (self.registry, scene),
+			lambda states: self.scene_applied(scene, states))
+
+	def scene_applied(self, scene, states):
+		model = self.model
+		model.freeze()
+		try:
+			for index, state in states:
+				self.read.add(index)
+				model.set_state(index, state)
+			for name, setting in scene.items():
+				index = model.index(name)
+				lock = setting[3]
+				if index is not None and lock is not None:
+					model.set_flag(index, LOCK, lock and model.masks[index] & LOCK)
+		finally:
+			model.thaw()
+		self.save_unlocked()
+
+	def state_read(self, channel, state):
+		self.model.set_state(channel, state)
+
+	def set_curve(self, name):
+		if self.model is not None:
+			self.model.set_curves([curve_for(name, ch.element)
+							for ch in self.channels])
+
+	def show_values(self, show):
+		if self.strip is not None:
+			for control in self.strip.controls():
+				control.show_values(show)
+
+	def show_hide_controls(self):
+		if self.strip is not None:
+			self.strip.set_positions(self.shown())
+			# Channels shown for the first time are read now
+			self.read_shown()
+
+	def natural_size(self):
+		if self.strip is None:
+			return (1, 1)
+		return self.strip.natural_size()
+
+	def close(self):
+		"""The card went away"""
+		self.deactivate()
+		self.scans += 1
+		self.window.worker.call(self.registry.invalidate)
+
+
+class Mixer(rox.Window):
+	"""A sound mixer class, with a notebook page for each sound card"""
+	def __init__(self):
+		rox.Window.__init__(self)
+		instrument.set_stats(instrument.stats or STATS.int_value)
+
+		# Update things when options change
+		rox.app_options.add_notify(self.get_options)
+
+		self.writes = WriteScheduler(WRITE_RATE.int_value)
+		self.worker = IOWorker()
+		self.watch = MixerWatch(self.worker)
+		self.server = None
+		self.control = None
+
+		self.pages = []
+		self.current = None
+		self.notebook = gtk.Notebook()
+		self.notebook.set_scrollable(True)
+		hbox = gtk.HBox()
+		hbox.pack_start(self.notebook)
+		self.add(hbox)
+		hbox.show()
+		self.notebook.show()
+
+		# The meter only runs while the window can be seen
+		self.meter_bar = gtk.ProgressBar()
+		self.meter_bar.set_orientation(gtk.PROGRESS_BOTTOM_TO_TOP)
+		self.meter_bar.set_size_request(METER_WIDTH, -1)
+		self.meter_bar.connect_after('expose-event',
+				lambda bar, event: draw_peak(bar, self.peak))
+		hbox.pack_end(self.meter_bar, False, False)
+		if METER.int_value:
+			self.meter_bar.show()
+		self.peak = None
+		self.meter = SignalMeter(self.meter_changed,
+						METER_DEVICE.value, METER_RATE.int_value)
+		self.visible = False
+		self.connect('map-event', self.visibility_changed, True)
+		self.connect('unmap-event', self.visibility_changed, False)
+		self.connect('visibility-notify-event', self.visibility_changed)
+		self.add_events(gtk.gdk.VISIBILITY_NOTIFY_MASK)
+		cards = topology.probed_cards()
+		for card in cards:
+			self.add_page(card)
+		self.notebook.connect('switch-page', self.page_switched)
+		self.show_page(self.find_page(MIXER_DEVICE.value))
+
+		self.cards = CardWatch(self.cards_changed)
+		self.cards.start()
+		self.retry_unavailable(cards)
 
 		self.add_events(gtk.gdk.BUTTON_PRESS_MASK)
 		self.connect('button-press-event', self.button_press)
 		self.menu = Menu.Menu('main', [
 			Menu.Action(_('Options'), 'show_options', '', gtk.STOCK_PREFERENCES),
+			Menu.Action(_('Statistics'), 'show_stats', ''),
 			Menu.Action(_('Info'), 'get_info', '', gtk.STOCK_DIALOG_INFO),
 			Menu.Action(_('Close'), 'quit', '', gtk.STOCK_CLOSE),
 			])
@@ -192,6 +497,127 @@ class Mixer(rox.Window):
 		self.connect('delete_event', self.quit)
 
 
+	def add_page(self, card):
+		"""Add a page for a card, in card order, if it has any channels"""
+		if not card.available or not card.volume_elements():
+			return
+		page = CardPage(self, card)
+		position = len([other for other in self.pages
+						if other.card_index < card.index])
+		self.pages.insert(position, page)
+		self.notebook.insert_page(page.box, page.label, position)
+		self.notebook.set_show_tabs(len(self.pages) > 1)
+
+	def remove_page(self, page):
+		if page is self.current:
+			self.current = None
+		page.close()
+		self.pages.remove(page)
+		self.notebook.remove_page(self.notebook.page_num(page.box))
+		self.notebook.set_show_tabs(len(self.pages) > 1)
+
+	def find_page(self, card_name):
+		"""Return the page of a card, or None"""
+		for page in self.pages:
+			if page.card_name == card_name:
+				return page
+		return None
+
+	def show_page(self, page):
+		"""Bring a page to the front, the first one if 'page' is None"""
+		if page is None:
+			if not self.pages:
+				return
+			page = self.pages[0]
+		num = self.notebook.page_num(page.box)
+		if num == self.notebook.get_current_page():
+			self.page_switched(self.notebook, None, num)
+		else:
+			self.notebook.set_current_page(num)
+
+	def page_switched(self, notebook, gpage, num):
+		box = notebook.get_nth_page(num)
+		pages = [page for page in self.pages if page.box is box]
+		if not pages or pages[0] is self.current:
+			# Unchanged, or a page being removed
+			return
+		page = pages[0]
+		if self.current is not None:
+			self.current.deactivate()
+		self.current = page
+		page.activate()
+		self.fit()
+
+	def fit(self):
+		"""Size the window for the current page, once it is built"""
+		if self.current is None or self.current.strip is None:
+			return
+		(x, y) = self.current.natural_size()
+		if len(self.pages) > 1:
+			y += TAB_HEIGHT
+		if METER.int_value:
+			x += METER_WIDTH
+		self.resize(x, y)
+
+	def visibility_changed(self, widget, event, mapped=None):
+		if mapped is None:
+			visible = event.state != gtk.gdk.VISIBILITY_FULLY_OBSCURED
+		else:
+			visible = mapped
+		if visible != self.visible:
+			self.visible = visible
+			self.update_meter()
+
+	def update_meter(self):
+		"""Run the meter only while it is on and the window can be seen"""
+		if METER.int_value and self.visible:
+			self.meter.start()
+		else:
+			self.meter.stop()
+
+	def meter_changed(self, fraction, peak):
+		self.meter_bar.set_fraction(fraction)
+		if peak != self.peak:
+			self.peak = peak
+			self.meter_bar.queue_draw()
+
+	def listen(self):
+		"""Take the commands of later launches, see headless.forward_launch()"""
+		try:
+			self.server_path = ipc.socket_path(headless.MIXER_SOCKET)
+			self.server = ipc.listen(self.server_path)
+		except (OSError, IOError), e:
+			print >>sys.stderr, 'Volume: no single instance socket: %s' % e
+			return
+		if self.server is not None:
+			self.server_source = ipc.watch(self.server, self.remote_command)
+
+	def remote_command(self, line, send):
+		"""Answer a request from another AppRun"""
+		words = line.split()
+		if not words:
+			# Another instance checking that we are alive
+			send('')
+			return
+		command = words[0]
+		if command == 'show':
+			self.present()
+		elif command == 'options':
+			self.show_options()
+		elif command == 'volume-options':
+			rox.edit_options(APP_DIR+'/Options.xml')
+		elif command in ('get', 'set', 'step', 'toggle-mute'):
+			# The applet's channel, which may be one of ours
+			if self.control is None:
+				self.control = headless.Control()
+			self.worker.call(headless.execute, (self.control, line), send,
+				lambda error: send('error: %s' % error))
+			return
+		else:
+			send('error: unknown command %s' % command)
+			return
+		send('ok')
+
 	def button_press(self, text, event):
 		'''Popup menu handler'''
 		if event.button != 3:
@@ -199,78 +625,104 @@ class Mixer(rox.Window):
 		self.menu.popup(self, event)
 		return 1
 
-	def setting_toggled(self, vol, channel, button, val):
-		"""Handle checkbox toggles"""
-		ch, id = get_alsa_channels()[channel]
-		mixer = alsaaudio.Mixer(ch, id, get_mixer_device())
-
-		if button == volumecontrol._MUTE:
-			mixer.setmute(val)
-
-		if button == volumecontrol._LOCK:
-			if val:
-				self.lock_mask |= (1<<channel)
+	def cards_changed(self):
+		"""A card was plugged in or removed, see what changed on the worker"""
+		self.worker.call(update_cards, (), self.cards_updated)
+
+	def cards_updated(self, changes):
+		"""Drop the pages of removed cards and add pages for new ones"""
+		if not changes:
+			return
+		removed = [card.index for card in changes.removed]
+		for page in self.pages[:]:
+			if page.card_index in removed:
+				self.remove_page(page)
 			else:
-				self.lock_mask &= ~(1<<channel)
-			MASK_LOCK._set(self.lock_mask)
-
-		if button == volumecontrol._REC:
-			mixer.setrec(val)
-
-
-	def adjust_volume(self, vol, channel, volume1, volume2):
-		"""Track changes to the volume controls"""
-		self.set_volume((volume1, volume2), channel)
-
-	def set_volume(self, volume, channel):
-		"""Set the playback volume"""
-		ch, id = get_alsa_channels()[channel]
-		mixer = alsaaudio.Mixer(ch, id, get_mixer_device())
-
-                for i, v in enumerate(volume):
-                    try:
-                            mixer.setvolume(int(v), i)
-                    except alsaaudio.ALSAAudioError:
-                            # No such channel.
-                            pass
-
-	def get_volume(self, channel):
-		"""Get the current sound card setting for specified channel"""
-		ch, id = get_alsa_channels()[channel]
-		mixer = alsaaudio.Mixer(ch, id, get_mixer_device())
-		vol = mixer.getvolume()
-		if len(vol) == 1:
-			return (vol[0], vol[0])
-		return (vol[0], vol[1])
+				page.follow(changes,
+					changes.moved.get(page.card_index, page.card_index))
+		for card in changes.added:
+			self.add_page(card)
+		if self.current is None:
+			self.show_page(self.find_page(MIXER_DEVICE.value))
+		self.retry_unavailable(changes.added)
+
+	def retry_unavailable(self, cards):
+		"""Probe again later if some of 'cards' did not answer in time"""
+		if [card for card in cards if not card.available]:
+			self.cards.retry()
+
+	def apply_scene(self, scene, card_name=None):
+		"""
+		Set a number of channels of a card (by default the one of the
+		Options) in one pass, see CardPage.apply_scene().
+		"""
+		page = self.find_page(card_name or MIXER_DEVICE.value)
+		if page is not None:
+			page.apply_scene(scene)
 
 	def get_options(self):
 		"""Used as the notify callback when options change"""
 		if SHOW_VALUES.has_changed:
-			controls = self.thing.get_children()
-			for control in controls:
-				control.show_values(bool(SHOW_VALUES.int_value))
-
-		if SHOW_CONTROLS.has_changed:
-			self.show_hide_controls()
-
-	def show_hide_controls(self):
-		controls = self.thing.get_children()
-		for control in controls:
-			if (SHOW_CONTROLS.int_value & (1 << control.channel)):
-				control.show()
+			for page in self.pages:
+				page.show_values(bool(SHOW_VALUES.int_value))
+
+		if VOLUME_CURVE.has_changed:
+			for page in self.pages:
+				page.set_curve(VOLUME_CURVE.value)
+
+		if SHOW_CONTROLS.has_changed or MIXER_DEVICE.has_changed:
+			# SHOW_CONTROLS is for the card of the Options only
+			for page in self.pages:
+				page.show_hide_controls()
+			if MIXER_DEVICE.has_changed:
+				self.show_page(self.find_page(MIXER_DEVICE.value))
+				# The card may have been plugged in since we last looked
+				self.cards_changed()
+			self.fit()
+
+		if WRITE_RATE.has_changed:
+			self.writes.set_rate(WRITE_RATE.int_value)
+
+		if STATS.has_changed:
+			instrument.set_stats(STATS.int_value)
+
+		if METER_DEVICE.has_changed or METER_RATE.has_changed:
+			self.meter.set_device(METER_DEVICE.value, METER_RATE.int_value)
+
+		if METER.has_changed:
+			if METER.int_value:
+				self.meter_bar.show()
 			else:
-				control.hide()
-		(x, y) = self.thing.size_request()
-		self.resize(x, y)
+				self.meter_bar.hide()
+			self.update_meter()
+			self.fit()
 
 	def show_options(self, button=None):
 		"""Options edit dialog"""
 		rox.edit_options(APP_DIR+'/Mixer.xml')
 
+	def show_stats(self):
+		"""Show the call statistics"""
+		if instrument.stats:
+			rox.info(instrument.stats_report())
+		else:
+			rox.info(_('Call statistics are off, turn them on in the Options.'))
+
 	def get_info(self):
 		InfoWin.infowin(APP_NAME)
 
 	def quit(self, ev=None, e1=None):
 		rox.app_options.save()
+		if self.server is not None:
+			gobject.source_remove(self.server_source)
+			ipc.close(self.server, self.server_path)
+			self.server = None
+		self.cards.stop()
+		self.meter.stop()
+		self.writes.flush()
+		self.worker.stop()
+		self.watch.clear()
+		for page in self.pages:
+			page.registry.invalidate()
+		pool.close(force=True)
 		self.destroy()
-
@@ -0,0 +1,157 @@
+"""
+	mixerpool.py (shared alsaaudio.Mixer handles)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import threading
+import alsaaudio
+import instrument
+
+TIMED_CALLS = ('getvolume', 'setvolume', 'getmute', 'setmute', 'getrec', 'setrec')
+
+
+def sync(mixer):
+	"""
+	Pick up changes made by other programs since the handle was opened.
+	A long lived handle only sees them after its events are handled.
+	"""
+	try:
+		mixer.handleevents()
+	except (AttributeError, alsaaudio.ALSAAudioError):
+		pass
+
+
+def close_handle(mixer):
+	try:
+		mixer.close()
+	except (AttributeError, alsaaudio.ALSAAudioError):
+		pass
+
+
+class TimedMixer:
+	"""
+	An alsaaudio.Mixer whose get/set calls are counted and timed while
+	the instrument statistics are on.
+	"""
+	def __init__(self, handle):
+		self.handle = handle
+		for name in TIMED_CALLS:
+			setattr(self, name, instrument.timed(name)(getattr(handle, name)))
+
+	def __getattr__(self, name):
+		return getattr(self.handle, name)
+
+
+class MixerPool:
+	"""
+	A pool of open mixer handles keyed by (card index, element name, id).
+
+	acquire() returns the open handle for an element, opening it only the
+	first time, and counts the users.  release() drops a reference; unused
+	handles stay open for the next acquire() until close() is called, e.g.
+	when the selected card changes or the program quits.  Elements that
+	failed to open are remembered too, so they are not probed again.
+	"""
+	def __init__(self):
+		self.handles = {}
+		self.refs = {}
+		self.keys = {}
+		self.failed = {}
+		# The cards are probed from several threads at once.  The lock
+		# only guards the tables, opening a handle can take long.
+		self.lock = threading.Lock()
+
+	def acquire(self, name, id=0, card_index=0):
+		"""Return an open handle, raises alsaaudio.ALSAAudioError on failure"""
+		key = (card_index, name, id)
+		self.lock.acquire()
+		try:
+			if key in self.failed:
+				raise self.failed[key]
+			mixer = self.handles.get(key)
+			if mixer is not None:
+				self.refs[key] += 1
+				return mixer
+		finally:
+			self.lock.release()
+
+		start = instrument.clock()
+		try:
+			mixer = TimedMixer(alsaaudio.Mixer(name, id, card_index))
+		except alsaaudio.ALSAAudioError, e:
+			self.failed[key] = e
+			raise
+		if instrument.stats:
+			instrument.record('open', instrument.clock() - start)
+
+		self.lock.acquire()
+		try:
+			if key in self.handles:
+				# Opened by another thread meanwhile, use that one.
+				extra, mixer = mixer, self.handles[key]
+			else:
+				extra = None
+				self.handles[key] = mixer
+				self.keys[mixer] = key
+				self.refs[key] = 0
+			self.refs[key] += 1
+		finally:
+			self.lock.release()
+		if extra is not None:
+			close_handle(extra)
+		return mixer
+
+	def probe(self, name, id=0, card_index=0):
+		"""Return an open handle without keeping a reference, or None"""
+		try:
+			mixer = self.acquire(name, id, card_index)
+		except alsaaudio.ALSAAudioError:
+			return None
+		self.release(mixer)
+		return mixer
+
+	def release(self, mixer):
+		"""Drop a reference to a handle returned by acquire()"""
+		self.lock.acquire()
+		try:
+			key = self.keys.get(mixer)
+			if key is not None and self.refs[key] > 0:
+				self.refs[key] -= 1
+		finally:
+			self.lock.release()
+
+	def close(self, card_index=None, force=False):
+		"""
+		Close the unused handles (of one card, or of all cards) and forget
+		failed elements.  With 'force' handles still in use are closed too.
+		"""
+		closed = []
+		self.lock.acquire()
+		try:
+			for key in self.failed.keys():
+				if card_index is None or key[0] == card_index:
+					del self.failed[key]
+			for key, mixer in self.handles.items():
+				if card_index is not None and key[0] != card_index:
+					continue
+				if self.refs[key] and not force:
+					continue
+				del self.handles[key]
+				del self.refs[key]
+				del self.keys[mixer]
+				closed.append(mixer)
+		finally:
+			self.lock.release()
+		for mixer in closed:
+			close_handle(mixer)
+
+
+pool = MixerPool()
@@ -0,0 +1,87 @@
+"""
+	mixerwatch.py (follow changes made to the mixer by other programs)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import gobject
+import alsaaudio
+import mixerpool
+
+
+class MixerWatch:
+	"""
+	Watch the poll descriptors of mixer handles from the GLib main loop.
+
+	A mixer handle is told about changes to any element of its card, so one
+	handle per card is enough.  When the card changes the pending events of
+	the handle are acknowledged and 'callback(mixer)' is called; nothing
+	runs while the card is idle.
+
+	With an IOWorker the events are acknowledged by the worker, and the
+	handle is not polled again until it has done so.
+	"""
+	def __init__(self, worker=None):
+		self.worker = worker
+		self.sources = {}
+		self.descriptors = {}
+
+	def add(self, mixer, callback):
+		"""Start watching 'mixer', returns False if it can't be polled"""
+		self.remove(mixer)
+		descriptors = self.descriptors.get(mixer)
+		if descriptors is None:
+			try:
+				descriptors = mixer.polldescriptors()
+			except (AttributeError, alsaaudio.ALSAAudioError):
+				return False
+			self.descriptors[mixer] = descriptors
+		sources = self.sources[mixer] = []
+		for fd, events in descriptors:
+			condition = events | gobject.IO_ERR | gobject.IO_HUP
+			sources.append(gobject.io_add_watch(fd, condition,
+								self.event, mixer, callback))
+		return bool(sources)
+
+	def remove(self, mixer):
+		"""Stop watching 'mixer'"""
+		for source in self.sources.pop(mixer, ()):
+			gobject.source_remove(source)
+
+	def forget(self, mixer):
+		"""Stop watching 'mixer', also if the worker is handling its events"""
+		self.remove(mixer)
+		self.descriptors.pop(mixer, None)
+
+	def clear(self):
+		"""Stop watching all handles"""
+		for mixer in self.sources.keys():
+			self.remove(mixer)
+		self.descriptors.clear()
+
+	def event(self, fd, condition, mixer, callback):
+		if condition & (gobject.IO_ERR | gobject.IO_HUP):
+			# The card went away, stop polling dead descriptors.
+			self.remove(mixer)
+			self.descriptors.pop(mixer, None)
+			return False
+		if self.worker is None:
+			mixerpool.sync(mixer)
+			callback(mixer)
+			return True
+		self.remove(mixer)
+		self.worker.call(mixerpool.sync, (mixer,),
+					lambda result: self.resume(mixer, callback))
+		return False
+
+	def resume(self, mixer, callback):
+		if mixer in self.descriptors:
+			self.add(mixer, callback)
+			callback(mixer)
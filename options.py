@@ -9,6 +9,8 @@ try:
 except:
 	rox.croak(_("You need to install the pyalsaaudio module"))
 
+from topology import topology
+
 
 APP_NAME = 'Volume'
 
@@ -20,28 +22,22 @@ Menu.set_save_name(APP_NAME, site='hayber.us')
 SHOW_ICON = Option('show_icon', True)
 SHOW_BAR = Option('show_bar', False)
 THEME = Option('theme', 'gtk-theme')
-
-volume_control = None
-mixer_device_name = None
-for card_index, card in enumerate(alsaaudio.cards()):
-	for channel in alsaaudio.mixers(card_index):
-		try:
-			mixer = alsaaudio.Mixer(channel, 0, card_index)
-		except alsaaudio.ALSAAudioError:
-			continue
-		if len(mixer.volumecap()):
-			if volume_control is None:
-				volume_control = channel
-			if mixer_device_name is None:
-				mixer_device_name = card
-
-if volume_control is None:
-	volume_control = 'Master'
-if mixer_device_name is None:
-	mixer_device_name = 'default'
-
-VOLUME_CONTROL = Option('mixer_channels', volume_control)
-MIXER_DEVICE = Option('mixer_device', mixer_device_name)
+WRITE_RATE = Option('write_rate', 60)
+STATS = Option('stats', False)
+PROBE_TIMEOUT = Option('probe_timeout', 5)
+# How slider positions map to levels, see curves.py
+VOLUME_CURVE = Option('volume_curve', 'db')
+# The signal level meter, see meter.py
+METER = Option('meter', False)
+METER_DEVICE = Option('meter_device', 'default')
+METER_RATE = Option('meter_rate', 20)
+# Later applets use the mixer of the first one, see volume.py
+SHARED_BACKEND = Option('shared_backend', False)
+
+# Left empty so the hardware is only scanned for a default when the option
+# has no saved value, see resolve_defaults().
+VOLUME_CONTROL = Option('mixer_channels', '')
+MIXER_DEVICE = Option('mixer_device', '')
 
 # Mixer options
 SHOW_VALUES = Option('show_values', False)
@@ -50,6 +46,10 @@ SHOW_CONTROLS = Option('controls', -1)
 MASK_LOCK = Option('lock_mask', -1)
 MASK_MUTE = Option('mute_mask', 0)
 
+# Names of the stereo channels whose sides move separately, replaces the
+# per-index bits of MASK_LOCK
+UNLOCKED_CHANNELS = Option('unlocked_channels', '')
+
 
 def build_mixer_devices_list(box, node, label, option):
 	hbox = gtk.HBox(False, 4)
@@ -61,22 +61,24 @@ def build_mixer_devices_list(box, node, label, option):
 	menu = gtk.Menu()
 	button.set_menu(menu)
 
-	for card_index, name in enumerate(alsaaudio.cards()):
-		show_card = False
-		for channel in alsaaudio.mixers(card_index):
-			try:
-				mixer = alsaaudio.Mixer(channel, 0, card_index)
-			except alsaaudio.ALSAAudioError:
-				continue
-			if len(mixer.volumecap()):
-				show_card = True
-				break
-		if show_card:
+	names = {}
+	for card in topology.probed_cards():
+		name = card.name
+		if not card.available:
+			# Listed so the user knows it is there, but not selectable.
+			label = _('%s (unavailable)') % name
+			names[label] = name
+			item = gtk.MenuItem(label)
+			item.set_sensitive(False)
+		elif card.volume_elements():
 			item = gtk.MenuItem(name)
-			menu.append(item)
-			item.show_all()
+		else:
+			continue
+		menu.append(item)
+		item.show_all()
 
 	def update_mixer_device():
+		resolve_defaults()
 		i = -1
 		for kid in menu.get_children():
 			i += 1
@@ -84,21 +86,64 @@ def build_mixer_devices_list(box, node, label, option):
 			if not item:
 				item = button.child
 			label = item.get_text()
-			if label == option.value:
+			if names.get(label, label) == option.value:
 				button.set_history(i)
 
-	def read_mixer_device(): return button.child.get_text()
+	def read_mixer_device():
+		label = button.child.get_text()
+		return names.get(label, label)
 	box.handlers[option] = (read_mixer_device, update_mixer_device)
 	button.connect('changed', lambda w: box.check_widget(option))
 	return [hbox]
 OptionsBox.widget_registry['mixer_devices_list'] = build_mixer_devices_list
 
 
+def find_default_control(card_name=None):
+	"""
+	Return (card name, element) for the first volume capable element,
+	looking at card 'card_name' first.
+	"""
+	return topology.default_control(card_name)
+
+
+def resolve_defaults():
+	"""Fill in MIXER_DEVICE and VOLUME_CONTROL if they were never saved"""
+	if MIXER_DEVICE.value and VOLUME_CONTROL.value:
+		return
+	card, channel = find_default_control(MIXER_DEVICE.value)
+	for option, value in ((MIXER_DEVICE, card), (VOLUME_CONTROL, channel)):
+		if not option.value:
+			option._set(value)
+			option.has_changed = False
+
+
 def get_mixer_device():
-    try:
-	    return alsaaudio.cards().index(MIXER_DEVICE.value)
-    except ValueError:
-	    return 0
+	resolve_defaults()
+	try:
+		return topology.card_names().index(MIXER_DEVICE.value)
+	except ValueError:
+		return 0
+
+
+def get_volume_control():
+	resolve_defaults()
+	return VOLUME_CONTROL.value
+
+
+def get_unlocked_channels(names):
+	"""
+	Return the names of the unlocked channels.  A lock_mask saved by an
+	older version is converted using 'names', the channels in index order.
+	"""
+	if MASK_LOCK.int_value != -1 and not UNLOCKED_CHANNELS.value:
+		set_unlocked_channels([name for n, name in enumerate(names)
+						if not MASK_LOCK.int_value & (1 << n)])
+		MASK_LOCK._set(-1)
+	return [name for name in UNLOCKED_CHANNELS.value.split(',') if name]
+
+
+def set_unlocked_channels(names):
+	UNLOCKED_CHANNELS._set(','.join(names))
 
 
 def build_channel_list(box, node, label, option):
@@ -113,14 +158,10 @@ def build_channel_list(box, node, label, option):
 
 		menu = gtk.Menu()
 		button.set_menu(menu)
-		mixer_device = get_mixer_device()
-		for channel in alsaaudio.mixers(mixer_device):
-			try:
-				mixer = alsaaudio.Mixer(channel, 0, mixer_device)
-			except alsaaudio.ALSAAudioError:
-				continue
-			if len(mixer.volumecap()):
-				item = gtk.MenuItem(channel)
+		card = topology.probed(get_mixer_device())
+		if card is not None:
+			for element in card.volume_elements():
+				item = gtk.MenuItem(element.name)
 				menu.append(item)
 				item.show_all()
 		button.set_history(0)
@@ -130,6 +171,7 @@ def build_channel_list(box, node, label, option):
 		menu = build()
 
 	def update_channel():
+		resolve_defaults()
 		i = -1
 		for kid in state.menu.get_children():
 			i += 1
@@ -155,4 +197,8 @@ def build_channel_list(box, node, label, option):
 	return [hbox]
 OptionsBox.widget_registry['channel_list'] = build_channel_list
 
+def set_probe_timeout():
+	topology.timeout = max(PROBE_TIMEOUT.int_value, 1)
+rox.app_options.add_notify(set_probe_timeout)
+
 rox.app_options.notify()
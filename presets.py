@@ -0,0 +1,176 @@
+"""
+	presets.py (named snapshots of the mixer settings)
+
+	A preset is a scene, as taken by channels.apply_scene(): element name
+	to (level, mute, rec, lock).  The presets of every card are kept in
+	the 'Presets' file next to the Options file, keyed by card name, so
+	they can be listed and restored without probing the hardware.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, cPickle
+from channels import read_states, apply_scene
+from topology import config_dir
+
+PRESETS_NAME = 'Presets'
+PRESETS_VERSION = 1
+
+
+def snapshot(registry, unlocked=None):
+	"""
+	Read every channel of a registry and return it as a scene.  The lock
+	is left out (None) unless the list of 'unlocked' names is given.
+	"""
+	scene = {}
+	for index, (level, mute, rec) in read_states(registry.channels()):
+		scene[registry[index].name] = (level, mute, rec, None)
+	if unlocked is not None:
+		set_locks(registry.channels(), scene, unlocked)
+	return scene
+
+
+def set_locks(channels, scene, unlocked):
+	"""Fill in the lock of the stereo channels of a scene"""
+	for ch in channels:
+		setting = scene.get(ch.name)
+		if setting is not None and ch.element.channels > 1:
+			scene[ch.name] = tuple(setting[:3]) + (ch.name not in unlocked,)
+
+
+def restore(registry, scene):
+	"""Apply a preset, writing only what differs, see apply_scene()"""
+	return apply_scene(registry, scene)
+
+
+# The registry of a window belongs to its worker thread, these return the
+# channels it has along with the result so the window need not touch it.
+
+def snapshot_channels(registry):
+	"""Return the channels of a registry and a snapshot() of them"""
+	return list(registry.channels()), snapshot(registry)
+
+
+def restore_channels(registry, scene):
+	"""Return the channels of a registry and the states restore() set"""
+	states = restore(registry, scene)
+	return list(registry.channels()), states
+
+
+def merge_unlocked(unlocked, scene):
+	"""Return the unlocked channel names after restoring 'scene'"""
+	unlocked = list(unlocked)
+	for name, setting in scene.items():
+		lock = setting[3]
+		if lock and name in unlocked:
+			unlocked.remove(name)
+		elif lock is not None and not lock and name not in unlocked:
+			unlocked.append(name)
+	return unlocked
+
+
+class PresetFile:
+	"""
+	The saved presets, a dictionary of card name to a dictionary of
+	preset name to scene.  The file is read on first use and written
+	again by save().
+	"""
+	def __init__(self, path=None):
+		if path is None:
+			path = os.path.join(config_dir(), PRESETS_NAME)
+		self.path = path
+		self.cards = None
+
+	def load(self):
+		"""(Re)read the file, an unreadable file means no presets"""
+		self.cards = {}
+		try:
+			f = open(self.path, 'rb')
+			try:
+				version, cards = cPickle.load(f)
+			finally:
+				f.close()
+		except Exception:
+			return
+		if version == PRESETS_VERSION:
+			self.cards = cards
+
+	def save(self):
+		"""Write the file, raises IOError or OSError on failure"""
+		tmp = self.path + '.new'
+		dir = os.path.dirname(self.path)
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		f = open(tmp, 'wb')
+		try:
+			cPickle.dump((PRESETS_VERSION, self.presets_by_card()), f, 2)
+		finally:
+			f.close()
+		os.rename(tmp, self.path)
+
+	def presets_by_card(self):
+		if self.cards is None:
+			self.load()
+		return self.cards
+
+	def names(self, card_name):
+		"""Return the preset names of a card, sorted"""
+		names = self.presets_by_card().get(card_name, {}).keys()
+		names.sort()
+		return names
+
+	def get(self, card_name, name):
+		"""Return a preset, or None if there is no such preset"""
+		return self.presets_by_card().get(card_name, {}).get(name)
+
+	def put(self, card_name, name, scene):
+		self.presets_by_card().setdefault(card_name, {})[name] = scene
+
+	def remove(self, card_name, name):
+		presets = self.presets_by_card().get(card_name, {})
+		if name in presets:
+			del presets[name]
+
+
+presets = PresetFile()
+
+
+def command(load_name=None, save_name=None):
+	"""
+	Restore or save a preset of the configured card without any window,
+	for AppRun --load-preset/--save-preset.  Returns the exit status.
+	"""
+	import sys
+	from channels import ChannelRegistry
+	from options import (get_mixer_device, get_unlocked_channels,
+		set_unlocked_channels, MIXER_DEVICE, MASK_LOCK, UNLOCKED_CHANNELS)
+	import rox
+
+	registry = ChannelRegistry(get_mixer_device())
+	card_name = MIXER_DEVICE.value
+	unlocked = get_unlocked_channels([ch.name for ch in registry.channels()])
+	if save_name:
+		presets.put(card_name, save_name, snapshot(registry, unlocked))
+		try:
+			presets.save()
+		except (IOError, OSError), e:
+			print >>sys.stderr, _('Failed to save the presets: %s') % e
+			return 1
+	else:
+		scene = presets.get(card_name, load_name)
+		if scene is None:
+			print >>sys.stderr, _('No preset "%s" for "%s"') % \
+								(load_name, card_name)
+			return 1
+		restore(registry, scene)
+		set_unlocked_channels(merge_unlocked(unlocked, scene))
+	if MASK_LOCK.has_changed or UNLOCKED_CHANNELS.has_changed:
+		rox.app_options.save()
+	return 0
@@ -0,0 +1,134 @@
+"""
+	ramp.py (smooth volume changes)
+
+	Jumping from one level to another, or muting at full volume, makes an
+	audible click.  A ramp moves a level to its target in small steps from
+	the gobject main loop instead.  The steps are even in slider positions
+	of the element's curve (see curves.py), which are even in loudness for
+	the 'db' curve.  The levels themselves are percentages of the raw
+	range, which most elements already step in dB, so they are not taken
+	as amplitudes.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import time
+import gobject
+from curves import LINEAR
+
+# Steps per second
+RAMP_RATE = 50
+
+
+class Ramp:
+	"""One level moving to its target along the slider of a curves.Curve"""
+	def __init__(self, level, target, duration, write, done, curve):
+		self.started = time.time()
+		self.duration = duration
+		self.curve = curve
+		self.start = [curve.position(v) for v in level]
+		self.end = [curve.position(v) for v in target]
+		self.target = tuple(target)
+		self.write = write
+		self.done = done
+
+	def level(self, now):
+		"""Return the level at time 'now', None once the ramp is over"""
+		fraction = (now - self.started) / self.duration
+		if fraction >= 1.0:
+			return None
+		return tuple([self.curve.hardware(a + (b - a) * fraction)
+				for a, b in zip(self.start, self.end)])
+
+
+class Ramps:
+	"""
+	The running ramps, keyed by element.
+
+	start() ramps a (left, right) level to a target, calling write(level)
+	at every step and done() after writing the target.  'curve' is the
+	curves.Curve of the element, the steps are even on its slider.  Starting a ramp
+	for an element that is already ramping replaces the old ramp, which
+	then continues from where it got to.  cancel() stops ramps where they
+	are, e.g. when the user grabs a slider, or finishes those with a
+	done() callback so it is not lost.
+	"""
+	def __init__(self, rate=RAMP_RATE):
+		self.ramps = {}
+		self.source = None
+		self.interval = 1.0 / rate
+
+	def start(self, key, level, target, duration, write, done=None,
+							curve=LINEAR):
+		old = self.ramps.get(key)
+		if old is not None:
+			level = old.level(time.time()) or old.target
+		if duration <= 0:
+			self.cancel(key)
+			write(tuple(target))
+			if done is not None:
+				done()
+			return
+		self.ramps[key] = Ramp(level, target, duration, write, done, curve)
+		if self.source is None:
+			self.source = gobject.timeout_add(int(self.interval * 1000),
+								self.tick)
+
+	def tick(self):
+		source = self.source
+		now = time.time()
+		for key, ramp in self.ramps.items():
+			if self.ramps.get(key) is not ramp:
+				# Replaced or cancelled by a callback of this tick
+				continue
+			level = ramp.level(now)
+			if level is None:
+				del self.ramps[key]
+				ramp.write(ramp.target)
+				if ramp.done is not None:
+					ramp.done()
+			else:
+				ramp.write(level)
+		if self.source != source:
+			# Cancelled and restarted meanwhile, the new source ticks
+			return False
+		if self.ramps:
+			return True
+		self.source = None
+		return False
+
+	def target(self, key):
+		"""Return the target of the ramp of an element, or None"""
+		ramp = self.ramps.get(key)
+		if ramp is None:
+			return None
+		return ramp.target
+
+	def cancel(self, key=None, finish=False):
+		"""
+		Stop the ramp of an element, or all ramps.  With 'finish' a ramp
+		that has a done() callback writes its target and calls it, as if
+		it had run to the end.
+		"""
+		if key is None:
+			keys = self.ramps.keys()
+		elif key in self.ramps:
+			keys = [key]
+		else:
+			keys = []
+		stopped = [self.ramps.pop(key) for key in keys]
+		if not self.ramps and self.source is not None:
+			gobject.source_remove(self.source)
+			self.source = None
+		if finish:
+			for ramp in stopped:
+				if ramp.done is not None:
+					ramp.write(ramp.target)
+					ramp.done()
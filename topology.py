@@ -0,0 +1,464 @@
+"""
+	topology.py (the sound cards and mixer elements, cached on disk)
+
+	Probing every element of every card is slow, and the result hardly
+	ever changes between sessions.  The cards, their elements and what
+	each element can do are saved in the 'Topology' file next to the
+	Options file and reused for as long as the fingerprint of the sound
+	hardware stays the same.
+
+	Listing the cards only takes alsaaudio.cards(); the elements of a
+	card are probed the first time they are asked for, see probed().
+	Cards are probed at the same time, one thread each, so a card that is
+	slow to answer (a USB DAC waking from suspend) only holds up its own
+	entry.  A card that does not answer within the timeout is listed as
+	unavailable.  It is asked for again when its elements are next needed
+	or on update(), and a probe that answered late gives its result then.
+
+	When a card is plugged in or removed, update() keeps what it knows
+	about the other cards.
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import os, glob, cPickle, threading
+import alsaaudio
+import instrument
+from mixerpool import pool
+
+SITE = 'hayber.us'
+PROGRAM = 'Volume'
+CACHE_NAME = 'Topology'
+CACHE_VERSION = 3
+
+# Seconds to wait for the cards to be probed
+PROBE_TIMEOUT = 5
+
+
+def config_dir():
+	"""The directory of the Options file, as used by rox.setup_app_options"""
+	base = os.environ.get('XDG_CONFIG_HOME') or \
+			os.path.join(os.path.expanduser('~'), '.config')
+	return os.path.join(base, SITE, PROGRAM)
+
+
+def read_line(path):
+	"""Return the first line of a file, None if it can't be read"""
+	try:
+		f = open(path)
+		try:
+			return f.readline()
+		finally:
+			f.close()
+	except IOError:
+		return None
+
+
+def fingerprint():
+	"""
+	A cheap summary of the sound hardware that stays the same from one
+	boot to the next: the list of cards in /proc/asound/cards (index, id
+	and name of each) and the codec of each card.  Cards plugged in or
+	removed while we run are followed by update().
+	"""
+	try:
+		f = open('/proc/asound/cards')
+		try:
+			cards = f.read()
+		finally:
+			f.close()
+	except IOError:
+		return repr(alsaaudio.cards())
+	# The first line of a codec file names it, the rest is live state.
+	codecs = [read_line(path) for path in
+			sorted(glob.glob('/proc/asound/card[0-9]*/codec#*'))]
+	return (cards, codecs)
+
+
+class Element:
+	"""A mixer element and its capabilities"""
+	def __init__(self, name, id, volumecap=(), switchcap=(), channels=1,
+					range=None, mute=False, rec=False, db_range=None):
+		self.name = name
+		self.id = id
+		self.volumecap = list(volumecap)
+		self.switchcap = list(switchcap)
+		self.channels = channels
+		self.range = range
+		# (lowest, highest) in dB, None if the element does not say
+		self.db_range = db_range
+		self.mute = mute
+		self.rec = rec
+
+
+class CardChanges:
+	"""
+	What update() did to the cards: the Cards 'added' and 'removed', the
+	cards that 'moved' (old index to new index), and 'stale', the indices
+	whose mixer handles were closed because their card went away or moved
+	to another index.  False if nothing changed.
+	"""
+	def __init__(self, added=(), removed=(), moved={}):
+		self.added = list(added)
+		self.removed = list(removed)
+		self.moved = dict(moved)
+		self.stale = set(self.moved.keys())
+		self.stale.update([card.index for card in self.removed])
+
+	def __nonzero__(self):
+		return bool(self.added or self.removed or self.stale)
+
+
+class Card:
+	"""
+	A sound card and its mixer elements.  'elements' is None until the
+	card is probed; an unavailable card could not be probed and has none.
+	"""
+	def __init__(self, index, name, elements=None, available=True):
+		self.index = index
+		self.name = name
+		self.elements = elements
+		self.available = available
+
+	def volume_elements(self):
+		"""Return the elements that have a volume control"""
+		return [element for element in self.elements or ()
+						if element.volumecap]
+
+
+def probe_element(mixer, name, id):
+	"""Ask an open mixer handle what its element can do"""
+	element = Element(name, id, mixer.volumecap())
+	try:
+		element.switchcap = list(mixer.switchcap())
+	except (AttributeError, alsaaudio.ALSAAudioError):
+		pass
+	if element.volumecap:
+		try:
+			element.channels = len(mixer.getvolume()) or 1
+		except alsaaudio.ALSAAudioError:
+			pass
+		try:
+			element.range = tuple(mixer.getrange())
+		except (AttributeError, alsaaudio.ALSAAudioError):
+			pass
+		element.db_range = probe_db_range(mixer)
+	for attr, get in (('mute', 'getmute'), ('rec', 'getrec')):
+		try:
+			setattr(element, attr, bool(getattr(mixer, get)()))
+		except alsaaudio.ALSAAudioError:
+			pass
+	return element
+
+
+def probe_db_range(mixer):
+	"""Return the dB range of an element, None if alsaaudio can't tell"""
+	units = getattr(alsaaudio, 'VOLUME_UNITS_DB', None)
+	if units is None:
+		# pyalsaaudio before 0.9
+		return None
+	for direction in (alsaaudio.PCM_PLAYBACK, alsaaudio.PCM_CAPTURE):
+		try:
+			low, high = mixer.getrange(direction, units)
+		except (TypeError, alsaaudio.ALSAAudioError):
+			continue
+		if low < high:
+			# In hundredths of a dB
+			return (low / 100.0, high / 100.0)
+	return None
+
+
+def probe_card(card_index, name):
+	"""Open every element of a card and return a Card describing it"""
+	elements = []
+	ids = {}
+	for element_name in alsaaudio.mixers(card_index):
+		id = ids.get(element_name, 0)
+		ids[element_name] = id + 1
+		mixer = pool.probe(element_name, id, card_index)
+		if mixer is None:
+			continue
+		elements.append(probe_element(mixer, element_name, id))
+	return Card(card_index, name, elements)
+
+
+def first_volume_element(card_index):
+	"""
+	Return the name of the first volume capable element of a card, or
+	None.  Only the elements up to that one are opened.
+	"""
+	start = instrument.clock()
+	try:
+		for name in alsaaudio.mixers(card_index):
+			mixer = pool.probe(name, 0, card_index)
+			if mixer is not None and mixer.volumecap():
+				return name
+		return None
+	finally:
+		instrument.phase('discovery', start)
+
+
+class CardProbe(threading.Thread):
+	"""probe_card() in a thread of its own"""
+	def __init__(self, card_index, name):
+		threading.Thread.__init__(self, name='probe card %d' % card_index)
+		self.setDaemon(True)
+		self.card_index = card_index
+		self.card_name = name
+		self.card = None
+
+	def run(self):
+		try:
+			self.card = probe_card(self.card_index, self.card_name)
+		except alsaaudio.ALSAAudioError:
+			pass
+
+	def result(self):
+		"""The Card, or an unavailable Card if the probe failed or is late"""
+		card = self.card
+		if card is None:
+			card = Card(self.card_index, self.card_name, [], False)
+		return card
+
+
+def locked(method):
+	"""Run a Topology method holding its lock"""
+	def run(self, *args):
+		self.lock.acquire()
+		try:
+			return method(self, *args)
+		finally:
+			self.lock.release()
+	run.__name__ = method.__name__
+	run.__doc__ = method.__doc__
+	return run
+
+
+class Topology:
+	"""
+	The sound cards of the machine.
+
+	The saved topology is loaded on first use.  When the saved fingerprint
+	does not match the cards are listed again and each card is probed
+	(and the cache rewritten) when its elements are first needed.
+	update() checks the fingerprint again, e.g. after a hotplug, and
+	retries the cards that were unavailable.
+
+	The probes that missed their deadline are kept in 'late', by (card
+	index, name), so they are waited for again instead of started anew.
+
+	The windows update the topology on their worker thread and read it
+	on the main thread; the public methods hold 'lock', so a card is
+	not probed twice and the cards do not change under a reader.
+	"""
+	def __init__(self, path=None):
+		if path is None:
+			path = os.path.join(config_dir(), CACHE_NAME)
+		self.path = path
+		self.timeout = PROBE_TIMEOUT
+		self.fingerprint = None
+		self.cards = None
+		self.late = {}
+		self.lock = threading.RLock()
+
+	def load(self):
+		"""Read the cache, returns False if it is missing or out of date"""
+		try:
+			f = open(self.path, 'rb')
+			try:
+				version, saved, cards = cPickle.load(f)
+			finally:
+				f.close()
+		except Exception:
+			return False
+		if version != CACHE_VERSION or saved != self.fingerprint:
+			return False
+		# A card that was unavailable is tried again when it is needed
+		self.cards = [card.available and card or Card(card.index, card.name)
+						for card in cards]
+		return True
+
+	def save(self):
+		"""Write the cache, failures only cost a probe next time"""
+		tmp = self.path + '.new'
+		try:
+			dir = os.path.dirname(self.path)
+			if not os.path.isdir(dir):
+				os.makedirs(dir)
+			f = open(tmp, 'wb')
+			try:
+				cPickle.dump((CACHE_VERSION, self.fingerprint, self.cards),
+								f, 2)
+			finally:
+				f.close()
+			os.rename(tmp, self.path)
+		except (IOError, OSError):
+			pass
+
+	@locked
+	def probe(self, cards):
+		"""
+		Probe those of 'cards' that were not probed yet or were unavailable,
+		all at once, and save the result.  Returns the Cards, probed, in
+		the same order.
+		"""
+		new = [(card.index, card.name) for card in cards
+						if card.elements is None or not card.available]
+		if new:
+			for card in self.probe_cards(new):
+				self.cards[card.index] = card
+			self.save()
+		return [self.cards[card.index] for card in cards]
+
+	def probe_cards(self, cards):
+		"""Probe the (index, name) cards at once, returns their Cards"""
+		start = instrument.clock()
+		probes = []
+		for key in cards:
+			probe = self.late.pop(key, None)
+			if probe is None or not (probe.isAlive() or probe.card):
+				probe = CardProbe(*key)
+				probe.start()
+			probes.append(probe)
+		deadline = start + self.timeout
+		for probe in probes:
+			probe.join(max(deadline - instrument.clock(), 0))
+			if probe.isAlive():
+				self.late[(probe.card_index, probe.card_name)] = probe
+		probed = [probe.result() for probe in probes]
+		# Handles of a card still being probed are left alone.
+		for card in probed:
+			if card.available:
+				pool.close(card.index)
+		instrument.phase('discovery', start)
+		return probed
+
+	@locked
+	def unavailable(self):
+		"""Return the cards that could not be probed"""
+		return [card for card in self.cards if not card.available]
+
+	@locked
+	def ensure(self):
+		"""Know the cards, from the cache or else without probing them"""
+		if self.cards is None:
+			self.fingerprint = fingerprint()
+			if not self.load():
+				self.cards = [Card(card_index, name) for card_index, name
+							in enumerate(alsaaudio.cards())]
+
+	@locked
+	def update(self):
+		"""
+		Follow cards being plugged in or removed, and retry unavailable
+		cards.  A known card keeps its elements, even if it moved to
+		another index; the added cards are not probed yet, see probe().
+		Returns the CardChanges.
+		"""
+		if self.cards is None:
+			self.ensure()
+			return CardChanges()
+		current = fingerprint()
+		if current == self.fingerprint and not self.unavailable():
+			return CardChanges()
+		self.fingerprint = current
+
+		known = {}
+		for card in self.cards:
+			if card.available:
+				known.setdefault(card.name, []).append(card)
+		cards = []
+		new = []
+		moved = {}
+		for card_index, name in enumerate(alsaaudio.cards()):
+			if known.get(name):
+				card = known[name].pop(0)
+				if card.index != card_index:
+					moved[card.index] = card_index
+					card = Card(card_index, name, card.elements)
+			else:
+				card = Card(card_index, name)
+				new.append(card)
+			cards.append(card)
+		removed = []
+		for same_name in known.values():
+			removed.extend(same_name)
+		changes = CardChanges(new, removed, moved)
+		for card_index in changes.stale:
+			# Their handles now point at another card, or at none.
+			pool.close(card_index, force=True)
+		self.cards = cards
+		self.save()
+		return changes
+
+	@locked
+	def card_names(self):
+		"""Return the card names in card index order"""
+		self.ensure()
+		return [card.name for card in self.cards]
+
+	@locked
+	def card(self, card_index):
+		"""Return the Card with index 'card_index', or None"""
+		self.ensure()
+		if 0 <= card_index < len(self.cards):
+			return self.cards[card_index]
+		return None
+
+	@locked
+	def probed(self, card_index):
+		"""Return the Card with index 'card_index' and its elements, or None"""
+		card = self.card(card_index)
+		if card is None:
+			return None
+		return self.probe([card])[0]
+
+	@locked
+	def probed_cards(self):
+		"""Return all the Cards and their elements"""
+		self.ensure()
+		return self.probe(self.cards)
+
+	@locked
+	def element(self, card_index, name, id=0):
+		"""Return the Element of a card, or None"""
+		card = self.probed(card_index)
+		if card is not None:
+			for element in card.elements:
+				if element.name == name and element.id == id:
+					return element
+		return None
+
+	@locked
+	def default_control(self, card_name=None):
+		"""
+		Return (card name, element name) for the first volume capable
+		element, looking at card 'card_name' first.  A card that was not
+		probed yet is not probed for this, the search stops at the first
+		usable element.
+		"""
+		cards = self.card_names()
+		order = range(len(cards))
+		if card_name in cards:
+			order.remove(cards.index(card_name))
+			order.insert(0, cards.index(card_name))
+		for card_index in order:
+			card = self.cards[card_index]
+			if card.elements is None:
+				name = first_volume_element(card_index)
+			else:
+				elements = card.volume_elements()
+				name = elements and elements[0].name
+			if name:
+				return card.name, name
+		return 'default', 'Master'
+
+
+topology = Topology()
@@ -18,12 +18,31 @@
 	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import rox, sys, os, gtk, gobject
+import rox, sys, os, socket, gtk, gobject, instrument, ipc, headless
 from rox import app_options, applet, Menu, InfoWin, OptionsBox
 from rox.options import Option
 from volumecontrol import VolumeControl
+import channels
+from channels import ChannelRegistry, read_hardware, write_hardware
+from presets import (
+    presets, snapshot_channels, restore_channels, set_locks, merge_unlocked
+)
+from channelstate import ChannelStore, STEREO, MUTE
+from mixerpool import pool
+from ioworker import IOWorker
+from mixerwatch import MixerWatch
+from writescheduler import WriteScheduler
+from iconcache import IconCache, icon_level
+from ramp import Ramps
+from hotplug import CardWatch
+from curves import curve_for, LINEAR
+from meter import SignalMeter, draw_peak
+from topology import topology, Element
 from options import (
-    get_mixer_device, MIXER_DEVICE, VOLUME_CONTROL, SHOW_ICON, SHOW_BAR, THEME
+    get_mixer_device, get_volume_control, get_unlocked_channels,
+    set_unlocked_channels, MIXER_DEVICE, VOLUME_CONTROL, VOLUME_CURVE,
+    SHOW_ICON, SHOW_BAR, THEME, WRITE_RATE, STATS, METER, METER_DEVICE,
+    METER_RATE, SHARED_BACKEND
 )
 
 try:
@@ -34,16 +53,54 @@ except ImportError:
 APP_DIR = rox.app_dir
 APP_SIZE = [28, 150]
 
+# Seconds taken by the fades of a scroll step, a mute and a preset change
+SCROLL_RAMP = 0.08
+MUTE_RAMP = 0.15
+PRESET_RAMP = 0.5
+
+
+class PanelState:
+	"""
+	The values shown by the panel widgets, and which of them changed since
+	the widgets were last refreshed.
+	"""
+	def __init__(self):
+		self.level = (0, 0)
+		self.mute = False
+		# The signal level and held peak of the meter, None while it is off
+		self.signal = None
+		self.peak = None
+		self.size = 24
+		self.theme = None
+		self.dirty = set()
+
+	def set(self, field, value):
+		"""Update a field, marking it dirty if the value is different"""
+		if getattr(self, field) != value:
+			setattr(self, field, value)
+			self.dirty.add(field)
+
+	def take_dirty(self):
+		"""Return the dirty fields and clear them"""
+		dirty = self.dirty
+		self.dirty = set()
+		return dirty
+
 
 class Volume(applet.Applet):
-	icons = []
-	size = 24
+	icons = IconCache(os.path.join(APP_DIR, 'themes'))
+	pixbuf = None
+	tip = None
+	fraction = None
+	refresh_source = None
+	write_seq = 0
 
 
 	"""An applet to control a sound card Master or PCM volume"""
 	def __init__(self, filename):
 		applet.Applet.__init__(self, filename)
                 self.set_name("VolumePanelApplet")
+		instrument.set_stats(instrument.stats or STATS.int_value)
 
 		self.vertical = self.get_panel_orientation() in ('Right', 'Left')
 		if self.vertical:
@@ -57,42 +114,65 @@ class Volume(applet.Applet):
 
 		self.add(self.box)
 
-		self.load_icons()
 		self.image = gtk.Image()
 		self.box.pack_start(self.image)
 
 		self.bar = gtk.ProgressBar()
 		self.bar.set_orientation(bar_orient)
 		self.bar.set_size_request(12,12)
+		self.bar.connect_after('expose-event',
+				lambda bar, event: draw_peak(bar, self.state.peak))
 		self.box.pack_end(self.bar)
 
 		self.tips = gtk.Tooltips()
+		self.state = PanelState()
+		self.state.set('theme', THEME.value)
+
+		# The applet's channel is channel 0 of its own store, named once
+		# the mixer is open here or in the host applet
+		self.store = ChannelStore()
+		self.store.add(VOLUME_CONTROL.value, STEREO | MUTE)
+		self.store.subscribe(self.channel_changed)
 
 		rox.app_options.add_notify(self.get_options)
 		self.connect('size-allocate', self.event_callback)
 		self.connect('scroll_event', self.button_scroll)
 
-		self.add_events(gtk.gdk.BUTTON_PRESS_MASK)
+		# The meter only runs while the panel shows it
+		self.meter = SignalMeter(self.meter_changed, METER_DEVICE.value,
+							METER_RATE.int_value)
+		self.visible = False
+		self.connect('map-event', self.visibility_changed, True)
+		self.connect('unmap-event', self.visibility_changed, False)
+		self.connect('visibility-notify-event', self.visibility_changed)
+
+		self.add_events(gtk.gdk.BUTTON_PRESS_MASK |
+						gtk.gdk.VISIBILITY_NOTIFY_MASK)
 		self.connect('button-press-event', self.button_press)
-		self.menu = Menu.Menu('main', [
-			Menu.Action(_('Mixer'), 'run_mixer', ''),
-			Menu.Action(_('Mute'), 'mute', ''),
-			Menu.Separator(),
-			Menu.Action(_('Options'), 'show_options', '', gtk.STOCK_PREFERENCES),
-			Menu.Action(_('Info'), 'get_info', '', gtk.STOCK_DIALOG_INFO),
-			Menu.Action(_('Close'), 'quit', '', gtk.STOCK_CLOSE),
-			])
+		self.menu = self.build_menu()
 		self.menu.attach(self, self)
 
 		self.thing = None
-		try:
-			self.mixer = alsaaudio.Mixer(VOLUME_CONTROL.value, 0, get_mixer_device())
-		except alsaaudio.ALSAAudioError:
-			rox.info(_('Failed to open Mixer device "%s". Please select a different device.\n') % get_mixer_device())
-			return
-
-		self.get_volume()
-		self.update_ui()
+		self.mixer = None
+		self.registry = None
+		self.worker = IOWorker()
+		self.watch = MixerWatch(self.worker)
+		self.writes = WriteScheduler(WRITE_RATE.int_value)
+		self.ramps = Ramps()
+		self.unmuted_level = None
+		self.cards = CardWatch(self.cards_changed)
+		self.card_index = None
+		self.element = None
+		self.curve = LINEAR
+
+		# The shared backend: the connection to the applet hosting the
+		# mixer, or the socket and connected applets if we host it
+		self.host = None
+		self.server = None
+		self.clients = {}
+		if not (SHARED_BACKEND.int_value and self.attach()):
+			if not self.start_backend():
+				return
 		self.show_all()
 		self.show()
 
@@ -102,42 +182,232 @@ class Volume(applet.Applet):
 			self.bar.hide()
 
 		def theme_changed(theme):
-		    self.load_icons()
-		    self.update_ui()
+		    self.icons.clear('gtk-theme')
+		    self.state.dirty.add('theme')
+		    self.queue_refresh()
 		gtk.icon_theme_get_default().connect("changed", theme_changed)
 
-	def load_icons(self):
-		self.icons = []
-
-		if THEME.value == 'gtk-theme':
-
-			theme = gtk.icon_theme_get_default()
-			fallback_theme_dir = os.path.join(APP_DIR, 'themes', 'GnomeSVG')
+	def start_backend(self):
+		"""Open the mixer in this applet, False if that failed"""
+		self.card_index = get_mixer_device()
+		self.store.rename(0, get_volume_control())
+		self.update_curve()
+		try:
+			self.mixer = pool.acquire(get_volume_control(), 0, self.card_index)
+		except alsaaudio.ALSAAudioError:
+			rox.info(_('Failed to open Mixer device "%s". Please select a different device.\n') % get_mixer_device())
+			return False
+
+		# The worker is not running yet, so read the mixer directly
+		self.hardware_read(read_hardware(self.mixer))
+		self.watch.add(self.mixer, self.hardware_changed)
+		self.cards.start()
+		if SHARED_BACKEND.int_value:
+			self.serve()
+		return True
+
+	def serve(self):
+		"""Let later applets and AppRun commands use our mixer"""
+		try:
+			self.server_path = ipc.socket_path(headless.APPLET_SOCKET)
+			self.server = ipc.listen(self.server_path)
+		except (OSError, IOError), e:
+			print >>sys.stderr, 'Volume: no shared backend socket: %s' % e
+			return
+		if self.server is not None:
+			self.server_source = gobject.io_add_watch(self.server,
+							gobject.IO_IN, self.client_connected)
+
+	def client_connected(self, server, condition):
+		ipc.accept(server, self.client_request)
+		return True
+
+	def client_request(self, conn, line):
+		"""Attach another applet, or answer an AppRun command"""
+		if line == 'attach':
+			stream = ipc.Stream(conn, self.client_command, self.client_closed)
+			# The number of the client's level writes we have seen
+			self.clients[stream] = 0
+			stream.send(self.channel_event())
+			stream.send(self.state_event(0))
+		else:
+			ipc.reply(conn, self.execute(line))
 
-			def load_icon_from_theme(icon_name):
-				try:
-					return theme.load_icon(icon_name, 24, 0)
-				except gobject.GError:
-					return gtk.gdk.pixbuf_new_from_file(os.path.join(fallback_theme_dir, '%s.svg' % icon_name))
+	def client_closed(self, stream):
+		del self.clients[stream]
 
-			self.icons.append(load_icon_from_theme('audio-volume-muted'))
-			self.icons.append(load_icon_from_theme('audio-volume-low'))
-			self.icons.append(load_icon_from_theme('audio-volume-medium'))
-			self.icons.append(load_icon_from_theme('audio-volume-high'))
+	def client_command(self, stream, line):
+		"""Do what an attached applet asks for"""
+		words = line.split('\t')
+		command = words[0]
+		try:
+			if command == 'set':
+				level = (int(words[1]), int(words[2]))
+				self.clients[stream] += 1
+				self.ramps.cancel(finish=True)
+				self.set_volume(tuple([min(max(v, 0), 100) for v in level]))
+			elif command == 'scroll':
+				step = int(words[1])
+				if step and abs(step) <= 100:
+					self.scroll(step)
+			elif command == 'toggle-mute':
+				self.mute()
+			elif command == 'load-preset':
+				self.load_preset(words[1])
+			elif command == 'save-preset' and words[1].strip():
+				self.store_preset(words[1].strip())
+			elif command == 'use':
+				self.use(*words[1:4])
+		except (IndexError, ValueError, TypeError):
+			# From a different version of the applet
+			pass
+
+	def execute(self, line):
+		"""Answer an AppRun command, see headless.execute()"""
+		words = line.split()
+		if not words:
+			return 'error: no command'
+		command = words[0]
+		try:
+			if command == 'set':
+				percent = min(max(int(words[1]), 0), 100)
+				self.ramps.cancel(finish=True)
+				self.set_volume((percent, percent))
+			elif command == 'step':
+				self.ramps.cancel(finish=True)
+				self.set_volume(channels.step_level(self.store.level(0),
+								int(words[1])))
+			elif command == 'toggle-mute':
+				self.mute()
+			elif command != 'get':
+				return 'error: unknown command %s' % command
+		except (IndexError, ValueError):
+			return 'error: %s needs a number' % command
+		self.writes.flush()
+		return headless.describe((self.store.level(0),
+						self.store.flag(0, MUTE)))
+
+	def use(self, card, element, curve):
+		"""Take the channel and curve chosen in an attached applet's Options"""
+		if not card or not element:
+			return
+		MIXER_DEVICE._set(card)
+		VOLUME_CONTROL._set(element)
+		VOLUME_CURVE._set(curve)
+		rox.app_options.notify()
+
+	def channel_event(self):
+		"""The line telling attached applets our channel and its curve"""
+		low = high = ''
+		if self.element is not None and self.element.db_range:
+			low, high = ['%.2f' % db for db in self.element.db_range]
+		return '\t'.join(('channel', MIXER_DEVICE.value, get_volume_control(),
+						VOLUME_CURVE.value, low, high))
+
+	def state_event(self, writes):
+		"""The line telling an attached applet the level and mute switch"""
+		(left, right), mute = self.store.level(0), self.store.flag(0, MUTE)
+		return 'state\t%d\t%d\t%s\t%d' % (left, right,
+					mute and 'muted' or 'unmuted', writes)
+
+	def tell_clients(self, line=None):
+		"""Send a line, or the state, to every attached applet"""
+		for stream, writes in self.clients.items():
+			stream.send(line or self.state_event(writes))
+
+	def attach(self):
+		"""
+		Use the mixer of the applet hosting the shared backend, False if
+		no applet does.
+		"""
+		try:
+			sock = ipc.connect(ipc.socket_path(headless.APPLET_SOCKET))
+		except (OSError, IOError):
+			return False
+		if sock is None:
+			return False
+		try:
+			sock.sendall('attach\n')
+			lines, data = ipc.read_lines(sock, 2)
+		except socket.error:
+			sock.close()
+			return False
+		# The host counts our level writes from here
+		self.write_seq = 0
+		self.host = ipc.Stream(sock, self.host_event, self.host_lost, data)
+		for line in lines:
+			self.host_event(self.host, line)
+		return True
+
+	def host_event(self, stream, line):
+		"""Follow the channel of the host applet"""
+		words = line.split('\t')
+		try:
+			if words[0] == 'state':
+				self.store.set_flag(0, MUTE, words[3] == 'muted')
+				# Don't undo writes the host has not seen yet.
+				if int(words[4]) == self.write_seq and not self.writes.pending:
+					self.store.set_level(0, (int(words[1]), int(words[2])))
+			elif words[0] == 'channel':
+				self.follow_host(*words[1:6])
+			elif words[0] == 'presets':
+				presets.load()
+		except (IndexError, ValueError, TypeError):
+			pass
+
+	def follow_host(self, card, element, curve, low, high):
+		"""Show the channel and curve the host applet uses"""
+		for option, value in ((MIXER_DEVICE, card), (VOLUME_CONTROL, element),
+							(VOLUME_CURVE, curve)):
+			option._set(value)
+			option.has_changed = False
+		self.store.rename(0, element)
+		db_range = None
+		if low and high:
+			db_range = (float(low), float(high))
+		self.show_curve(curve_for(curve, Element(element, 0, db_range=db_range)))
+
+	def host_lost(self, stream):
+		"""The host applet went away: attach to the next one, or host"""
+		if stream is not self.host:
 			return
-		theme_dir = os.path.join(APP_DIR, 'themes', THEME.value)
-		self.icons.append(gtk.gdk.pixbuf_new_from_file(os.path.join(theme_dir, 'audio-volume-muted.svg')))
-		self.icons.append(gtk.gdk.pixbuf_new_from_file(os.path.join(theme_dir, 'audio-volume-low.svg')))
-		self.icons.append(gtk.gdk.pixbuf_new_from_file(os.path.join(theme_dir, 'audio-volume-medium.svg')))
-		self.icons.append(gtk.gdk.pixbuf_new_from_file(os.path.join(theme_dir, 'audio-volume-high.svg')))
+		self.host = None
+		self.writes.cancel('volume')
+		if not self.attach():
+			self.start_backend()
+
+	def tell_host(self, *words):
+		self.host.send('\t'.join([str(word) for word in words]))
+
+	def stop_sharing(self):
+		"""Close the shared backend socket and the connections over it"""
+		host, self.host = self.host, None
+		if host is not None:
+			host.close()
+		for stream in self.clients.keys():
+			stream.close()
+		if self.server is not None:
+			gobject.source_remove(self.server_source)
+			ipc.close(self.server, self.server_path)
+			self.server = None
 
 	def button_scroll(self, window, event):
-		vol = self.bar.get_fraction()
 		if event.direction == 0:
-			vol += 0.02
+			self.scroll(2)
 		elif event.direction == 1:
-			vol -= 0.02
-		self.set_volume((vol*100, vol*100))
+			self.scroll(-2)
+
+	def scroll(self, step):
+		"""Step the volume by 'step' slider positions"""
+		if self.host is not None:
+			self.tell_host('scroll', step)
+			return
+		# Quick scrolls add up: step from where the fade is going
+		key = self.store.names[0]
+		level = self.store.level(0)
+		base = self.ramps.target(key) or level
+		self.ramps.start(key, level, self.curve.step(base, step), SCROLL_RAMP,
+							self.set_volume, curve=self.curve)
 
 	def event_callback(self, widget, rectangle):
 		"""Called when the panel sends a size."""
@@ -145,15 +415,8 @@ class Volume(applet.Applet):
 			size = rectangle[2]
 		else:
 			size = rectangle[3]
-		if size != self.size:
-			self.resize_image(size)
-
-	def resize_image(self, size):
-		"""Called to resize the image."""
-		#I like the look better with the -2, there is no technical reason for it.
-		scaled_pixbuf = self.pixbuf.scale_simple(size-2, size-2, gtk.gdk.INTERP_BILINEAR)
-		self.image.set_from_pixbuf(scaled_pixbuf)
-		self.size = size
+		self.state.set('size', size)
+		self.queue_refresh()
 
 	def button_press(self, window, event):
 		"""Show/Hide the volume control on button 1 and the menu on button 3"""
@@ -165,11 +428,33 @@ class Volume(applet.Applet):
 					self.show_volume(event)
 		elif event.button == 3:
 			self.hide_volume()
+			if self.menu_presets != presets.names(MIXER_DEVICE.value):
+				self.menu = self.build_menu()
 			self.menu.popup(self, event, self.position_menu)
 
+	def build_menu(self):
+		"""The applet menu, with an item for each preset of the card"""
+		self.menu_presets = presets.names(MIXER_DEVICE.value)
+		preset_items = [Menu.Action(name, 'load_preset', '', None, (name,))
+						for name in self.menu_presets]
+		if preset_items:
+			preset_items.append(Menu.Separator())
+		preset_items.append(Menu.Action(_('Save Preset...'), 'save_preset', ''))
+		return Menu.Menu('main', [
+			Menu.Action(_('Mixer'), 'run_mixer', ''),
+			Menu.Action(_('Mute'), 'mute', ''),
+			Menu.SubMenu(_('Presets'), preset_items),
+			Menu.Separator(),
+			Menu.Action(_('Options'), 'show_options', '', gtk.STOCK_PREFERENCES),
+			Menu.Action(_('Statistics'), 'show_stats', ''),
+			Menu.Action(_('Info'), 'get_info', '', gtk.STOCK_DIALOG_INFO),
+			Menu.Action(_('Close'), 'quit', '', gtk.STOCK_CLOSE),
+			])
+
 	def hide_volume(self, event=None):
 		"""Destroy the popup volume control"""
 		if self.thing:
+			self.writes.flush()
 			self.thing.destroy()
 			self.thing = None
 			return True
@@ -230,8 +515,10 @@ class Volume(applet.Applet):
 		self.thing.set_decorated(False)
 
 		self.volume = VolumeControl(0, 0, 0, True, None, self.set_position())
-		self.volume.set_level(self.get_volume())
+		self.volume.set_curve(self.curve)
+		self.volume.set_level(self.store.level(0))
 		self.volume.connect("volume_changed", self.adjust_volume)
+		self.volume.connect("volume_released", lambda *args: self.writes.flush())
 
 		self.thing.add(self.volume)
 		self.thing.show_all()
@@ -239,67 +526,233 @@ class Volume(applet.Applet):
 
 	def adjust_volume(self, vol, channel, vol_left, vol_right):
 		"""Set the playback volume"""
+		# The user has the slider, stop any fade
+		self.ramps.cancel(finish=True)
 		self.set_volume((vol_left, vol_right))
 
 	def set_volume(self, vol):
+		"""Show the new volume and queue it for the mixer"""
+		self.store.set_level(0, vol)
+		self.writes.schedule('volume', self.write_volume, vol)
+
+	@instrument.timed('applet write')
+	def write_volume(self, vol):
 		"""Send the volume setting(s) to the mixer """
-		for i, v in enumerate(vol):
-			try:
-			        self.mixer.setvolume(int(v), i)
-			except alsaaudio.ALSAAudioError:
-				pass
-		self.level = vol
-		self.update_ui()
-
-	def get_volume(self):
-		"""Get the volume settings from the mixer"""
-		vol = self.mixer.getvolume()
-		if len(vol) == 1:
-			vol = vol + vol
-		self.level = vol
-		return (vol[0], vol[1])
+		self.write_seq += 1
+		if self.host is not None:
+			self.tell_host('set', int(vol[0]), int(vol[1]))
+			return
+		seq = self.write_seq
+		self.worker.call(write_hardware, (self.mixer, vol),
+			lambda level: self.reconcile(seq, level),
+			lambda error: self.hardware_changed(self.mixer))
+
+	def reconcile(self, seq, level):
+		"""Show what the mixer made of our latest write"""
+		if seq == self.write_seq and not self.writes.pending:
+			self.store.set_level(0, level)
+
+	@instrument.timed('applet hw change')
+	def hardware_changed(self, mixer):
+		"""Follow changes made to the mixer by other programs"""
+		seq = self.write_seq
+		self.worker.call(read_hardware, (mixer,),
+			lambda state: self.hardware_read(state, seq))
+
+	def hardware_read(self, state, seq=None):
+		level, mute = state
+		self.store.set_flag(0, MUTE, mute)
+		# Don't undo writes the mixer has not seen yet.
+		if seq is None or (seq == self.write_seq and not self.writes.pending):
+			self.store.set_level(0, level)
 
 	def mute(self):
-		try:
-			mute = self.mixer.getmute()[0]
-			if mute:
-				self.mixer.setmute(0)
+		"""Toggle the mute switch, fading the volume out before or in after"""
+		key = self.store.names[0]
+		mute = not self.store.flag(0, MUTE)
+		if self.host is not None:
+			self.store.set_flag(0, MUTE, mute)
+			self.tell_host('toggle-mute')
+			return
+		fading = self.ramps.target(key) is not None
+		if not (fading and self.unmuted_level):
+			self.unmuted_level = self.store.level(0)
+		level = self.unmuted_level
+		self.store.set_flag(0, MUTE, mute)
+		if mute:
+			self.ramps.start(key, self.store.level(0), (0, 0), MUTE_RAMP,
+				self.set_volume, lambda: self.set_mute(True, level), self.curve)
+		else:
+			if not fading:
+				# Unmute at zero, the level is still set while muted
+				self.set_volume((0, 0))
+			self.set_mute(False)
+			self.ramps.start(key, self.store.level(0), level, MUTE_RAMP,
+				self.set_volume, curve=self.curve)
+
+	def set_mute(self, mute, level=None):
+		"""Set the mute switch, then the level if given"""
+		self.writes.flush()
+		self.worker.call(channels.set_mute, (self.mixer, mute),
+			lambda mute: self.store.set_flag(0, MUTE, mute),
+			lambda error: self.mute_failed(not mute))
+		if level is not None:
+			self.set_volume(level)
+			self.writes.flush()
+
+	def card_registry(self):
+		"""
+		The channels of the card, only to be used by the worker; its jobs
+		hand back the channels the main loop needs.
+		"""
+		if self.registry is None:
+			self.registry = ChannelRegistry(get_mixer_device())
+		return self.registry
+
+	def load_preset(self, name):
+		"""Restore a preset of the card, writing only what differs"""
+		if self.host is not None:
+			self.tell_host('load-preset', name)
+			return
+		scene = presets.get(MIXER_DEVICE.value, name)
+		if scene is None:
+			return
+		self.writes.flush()
+		# The switches are set at once, the levels fade to the preset
+		switches = {}
+		for element, setting in scene.items():
+			switches[element] = (None,) + tuple(setting[1:])
+		self.worker.call(restore_channels, (self.card_registry(), switches),
+			lambda result: self.preset_switched(scene, *result))
+
+	def preset_switched(self, scene, channels, states):
+		for index, (level, mute, rec) in states:
+			ch = channels[index]
+			target = scene[ch.name][0]
+			if target is None:
+				continue
+			if not isinstance(target, (tuple, list)):
+				target = (target, target)
+			if ch.name == self.store.names[0]:
+				write = self.set_volume
+				curve = self.curve
 			else:
-				self.mixer.setmute(2)
-			self.update_ui()
-		except alsaaudio.ALSAAudioError:
-			rox.info(_('Device does not support Muting.'))
-
-	def update_ui(self):
-		vol = self.level
-		try: mute = self.mixer.getmute()[0]
-		except alsaaudio.ALSAAudioError: mute = False
-
-		if (vol[0] <= 0) or mute:
-			self.pixbuf = self.icons[0]
-		elif vol[0] >= 66:
-			self.pixbuf = self.icons[3]
-		elif vol[0] >= 33:
-			self.pixbuf = self.icons[2]
+				write = lambda level, ch=ch: \
+					self.writes.schedule(ch.name, self.write_channel, ch, level)
+				curve = curve_for(VOLUME_CURVE.value, ch.element)
+			self.ramps.start(ch.name, level, target, PRESET_RAMP, write,
+							curve=curve)
+		self.preset_restored(scene, channels)
+
+	def write_channel(self, ch, level):
+		self.worker.call(ch.set_level, (level,))
+
+	def preset_restored(self, scene, channels):
+		unlocked = get_unlocked_channels([ch.name for ch in channels])
+		merged = merge_unlocked(unlocked, scene)
+		if merged != unlocked:
+			set_unlocked_channels(merged)
+			rox.app_options.save()
+		self.hardware_changed(self.mixer)
+
+	def save_preset(self):
+		"""Ask for a name and save the settings of the card under it"""
+		dialog = rox.Dialog(_('Save Preset'), None, 0,
+			(gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+			 gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+		dialog.set_default_response(gtk.RESPONSE_OK)
+		entry = gtk.Entry()
+		entry.set_activates_default(True)
+		dialog.vbox.pack_start(entry, False, True, 4)
+		dialog.vbox.show_all()
+		response = dialog.run()
+		name = entry.get_text().strip()
+		dialog.destroy()
+		if response != gtk.RESPONSE_OK or not name:
+			return
+		self.store_preset(name)
+
+	def store_preset(self, name):
+		if self.host is not None:
+			self.tell_host('save-preset', name)
+			return
+		self.writes.flush()
+		self.worker.call(snapshot_channels, (self.card_registry(),),
+			lambda result: self.preset_read(name, *result))
+
+	def preset_read(self, name, channels, scene):
+		unlocked = get_unlocked_channels([ch.name for ch in channels])
+		set_locks(channels, scene, unlocked)
+		presets.put(MIXER_DEVICE.value, name, scene)
+		try:
+			presets.save()
+		except (IOError, OSError), e:
+			rox.alert(_('Failed to save the presets: %s') % e)
 		else:
-			self.pixbuf = self.icons[1]
+			self.tell_clients('presets')
+
+	def mute_failed(self, mute):
+		self.store.set_flag(0, MUTE, mute)
+		rox.info(_('Device does not support Muting.'))
+
+	def channel_changed(self, indices):
+		"""Schedule a refresh of the widgets showing the channel"""
+		self.state.set('level', self.store.level(0))
+		self.state.set('mute', self.store.flag(0, MUTE))
+		self.queue_refresh()
+		self.tell_clients()
+
+	def queue_refresh(self):
+		"""Refresh the widgets once, before the next redraw"""
+		if self.state.dirty and self.refresh_source is None:
+			self.refresh_source = gobject.idle_add(self.refresh,
+								priority=gobject.PRIORITY_HIGH_IDLE)
+
+	@instrument.timed('applet refresh')
+	def refresh(self):
+		"""Update only the widgets whose input changed"""
+		self.refresh_source = None
+		dirty = self.state.take_dirty()
+		vol = self.state.level
+		# Shown as the slider would show it
+		shown = [self.curve.position(v) for v in vol]
+
+		if dirty & set(('level', 'mute', 'size', 'theme')):
+			#I like the look better with the -2, there is no technical reason for it.
+			icon = icon_level(shown[0], self.state.mute)
+			pixbuf = self.icons.get(self.state.theme, icon, self.state.size-2)
+			if pixbuf is not self.pixbuf:
+				self.image.set_from_pixbuf(pixbuf)
+				self.pixbuf = pixbuf
+
+		if 'level' in dirty:
+			tip = _('Volume control') + ': %d%%' % min(shown)
+			if tip != self.tip:
+				self.tips.set_tip(self, tip)
+				self.tip = tip
+			if self.thing:
+				self.volume.set_level(vol)
+
+		if dirty & set(('level', 'signal')):
+			if self.state.signal is None:
+				fraction = max(shown)/100.0
+			else:
+				fraction = self.state.signal
+			if fraction != self.fraction:
+				self.bar.set_fraction(fraction)
+				self.fraction = fraction
 
-		self.resize_image(self.size)
-		self.tips.set_tip(self, _('Volume control') + ': %d%%' % min(vol[0], vol[1]))
-		if self.thing:
-			self.volume.set_level((vol[0], vol[1]))
-		self.bar.set_fraction(max(vol[0], vol[1])/100.0)
+		if 'peak' in dirty:
+			self.bar.queue_draw()
+		return False
 
 	def get_options(self):
 		"""Used as the notify callback when options change"""
 		if VOLUME_CONTROL.has_changed or MIXER_DEVICE.has_changed:
-			try:
-				self.mixer = alsaaudio.Mixer(VOLUME_CONTROL.value, 0, get_mixer_device())
-			except alsaaudio.ALSAAudioError:
-				pass
-			else:
-				self.get_volume()
-				self.update_ui()
+			self.open_mixer()
+
+		if VOLUME_CURVE.has_changed:
+			self.update_curve()
 
 		if SHOW_BAR.has_changed:
 			if SHOW_BAR.int_value:
@@ -307,20 +760,127 @@ class Volume(applet.Applet):
 			else:
 				self.bar.hide()
 
+		if METER_DEVICE.has_changed or METER_RATE.has_changed:
+			self.meter.set_device(METER_DEVICE.value, METER_RATE.int_value)
+
+		if METER.has_changed or SHOW_BAR.has_changed:
+			self.update_meter()
+
 		if SHOW_ICON.has_changed:
 			if SHOW_ICON.int_value:
 				self.image.show()
 			else:
 				self.image.hide()
 
+		if WRITE_RATE.has_changed:
+			self.writes.set_rate(WRITE_RATE.int_value)
+
+		if STATS.has_changed:
+			instrument.set_stats(STATS.int_value)
+
 		if THEME.has_changed:
-			self.load_icons()
-			self.update_ui()
+			self.state.set('theme', THEME.value)
+			self.queue_refresh()
+
+	def open_mixer(self):
+		"""Open the element chosen in the Options, False if that failed"""
+		if self.host is not None:
+			self.use_options()
+			return True
+		card_index = get_mixer_device()
+		try:
+			mixer = pool.acquire(get_volume_control(), 0, card_index)
+		except alsaaudio.ALSAAudioError:
+			return False
+		self.writes.flush()
+		if self.mixer is not None:
+			pool.release(self.mixer)
+		self.mixer = mixer
+		self.card_index = card_index
+		self.update_curve()
+		if self.registry is not None:
+			self.worker.call(self.registry.set_card, (card_index,))
+		self.store.rename(0, get_volume_control())
+		self.watch.clear()
+		self.watch.add(self.mixer, self.hardware_changed)
+		self.hardware_changed(self.mixer)
+		return True
+
+	def visibility_changed(self, widget, event, mapped=None):
+		if mapped is None:
+			visible = event.state != gtk.gdk.VISIBILITY_FULLY_OBSCURED
+		else:
+			visible = mapped
+		if visible != self.visible:
+			self.visible = visible
+			self.update_meter()
+
+	def update_meter(self):
+		"""Run the meter only while it is on and its bar can be seen"""
+		if METER.int_value and SHOW_BAR.int_value and self.visible:
+			self.meter.start()
+		else:
+			self.meter.stop()
+			if not METER.int_value:
+				self.state.set('signal', None)
+				self.state.set('peak', None)
+				self.queue_refresh()
+
+	def meter_changed(self, fraction, peak):
+		if METER.int_value:
+			self.state.set('signal', fraction)
+			self.state.set('peak', peak)
+			self.queue_refresh()
+
+	def update_curve(self):
+		"""Take the slider curve of the Options for the applet's element"""
+		if self.host is not None:
+			self.use_options()
+			return
+		self.element = topology.element(self.card_index, get_volume_control())
+		self.show_curve(curve_for(VOLUME_CURVE.value, self.element))
+		self.tell_clients(self.channel_event())
+
+	def use_options(self):
+		"""Have the host applet use the channel and curve of our Options"""
+		self.tell_host('use', MIXER_DEVICE.value, VOLUME_CONTROL.value,
+						VOLUME_CURVE.value)
+
+	def show_curve(self, curve):
+		self.curve = curve
+		if self.thing:
+			self.volume.set_curve(self.curve)
+		self.state.dirty.add('level')
+		self.queue_refresh()
+
+	def cards_changed(self):
+		"""A card was plugged in or removed, see what changed on the worker"""
+		self.worker.call(topology.update, (), self.cards_updated)
+
+	def cards_updated(self, changes):
+		"""Reopen the mixer only if its card went, moved or came back"""
+		if not changes:
+			return
+		if self.card_index in changes.stale:
+			# The handle was closed, reopen even at the same index
+			self.card_index = None
+		card_index = get_mixer_device()
+		if self.registry is not None:
+			self.worker.call(self.registry.follow, (changes, card_index))
+		if card_index != self.card_index:
+			self.open_mixer()
 
 	def show_options(self, button=None):
 		"""Options edit dialog"""
 		rox.edit_options()
 
+	def show_stats(self):
+		"""Show the call statistics"""
+		if instrument.stats:
+			rox.info(instrument.stats_report())
+		else:
+			rox.info(_('Call statistics are off, turn them on in the Options.'))
+
 	def get_info(self):
 		"""Display an InfoWin box"""
 		InfoWin.infowin(APP_NAME)
@@ -331,4 +891,14 @@ class Volume(applet.Applet):
 
 	def quit(self):
 		"""Quit"""
+		if self.refresh_source is not None:
+			gobject.source_remove(self.refresh_source)
+		self.ramps.cancel(finish=True)
+		self.meter.stop()
+		self.cards.stop()
+		self.writes.flush()
+		self.stop_sharing()
+		self.worker.stop()
+		self.watch.clear()
+		pool.close(force=True)
 		self.destroy()
@@ -19,16 +19,18 @@
 """
 
 import rox, gtk, gobject, sys
+import channelstate
+from curves import LINEAR
 
 CHANNEL_LEFT	= 0
 CHANNEL_RIGHT	= 1
 CHANNEL_MONO	= 2
 
 #bitmask values
-_STEREO	= 1
-_LOCK	= 2
-_REC	= 4
-_MUTE	= 8
+_STEREO	= channelstate.STEREO
+_LOCK	= channelstate.LOCK
+_REC	= channelstate.REC
+_MUTE	= channelstate.MUTE
 
 class VolumeControl(gtk.Frame):
 	"""
@@ -48,9 +50,13 @@ class VolumeControl(gtk.Frame):
 
 		The widget supports two signals 'volume_changed' and 'volume_setting_toggled'.
 		'volume_changed' always sends left and right volume settings regardless of
-		whether the control is locked or mono.
+		whether the control is locked or mono.  The levels are those of the
+		sliders' curve (see set_curve()), not the slider positions.
 
 		'volume_setting_toggled' notifies the parent of changes in the optional checkboxes.
+
+		'volume_released' tells the parent that a slider was let go, so the
+		final level can be written without delay.
 		"""
 		gtk.Frame.__init__(self, label)
 
@@ -70,8 +76,12 @@ class VolumeControl(gtk.Frame):
 		if option_mask & _STEREO:
 			self.stereo = True
 
+		self.option_mask = option_mask
 		self.channel = channel
 		self.vol_left = self.vol_right = 0
+		self.curve = LINEAR
+		# Set while the parent updates the widget, nothing is emitted then
+		self.quiet = False
 		self.set_size_request(-1, 200)
 
 		vbox = gtk.VBox()
@@ -82,10 +92,10 @@ class VolumeControl(gtk.Frame):
 		self.volume1 = gtk.Adjustment(0.0, 0.0, 100.0, 1.0, 10.0, 0.0)
 		if self.stereo:
 			self.volume1.connect('value_changed', self.value_changed,
-						channel, CHANNEL_LEFT)
+						CHANNEL_LEFT)
 		else:
 			self.volume1.connect('value_changed', self.value_changed,
-						channel, CHANNEL_MONO)
+						CHANNEL_MONO)
 
 		if vertical:
 			volume1_control = gtk.VScale(self.volume1)
@@ -100,7 +110,7 @@ class VolumeControl(gtk.Frame):
 		if self.stereo:
 			self.volume2 = gtk.Adjustment(0.0, 0.0, 100.0, 1.0, 10.0, 0.0)
 			self.volume2.connect('value_changed', self.value_changed,
-						channel, CHANNEL_RIGHT)
+						CHANNEL_RIGHT)
 
 			if vertical:
 				volume2_control = gtk.VScale(self.volume2)
@@ -115,27 +125,31 @@ class VolumeControl(gtk.Frame):
 		if self.rec:
 			rec_check = gtk.CheckButton(label=_('Rec.'))
 			rec_check.set_active(self.channel_rec)
-			rec_check.connect('toggled', self.check, channel, _REC)
+			rec_check.connect('toggled', self.check, _REC)
 			vbox.pack_end(rec_check, False, False)
 			self.rec_check = rec_check
 
 		if self.mute:
 			mute_check = gtk.CheckButton(label=_('Mute'))
 			mute_check.set_active(self.channel_muted)
-			mute_check.connect('toggled', self.check, channel, _MUTE)
+			mute_check.connect('toggled', self.check, _MUTE)
 			vbox.pack_end(mute_check, False, False)
+			self.mute_check = mute_check
 
 		if self.stereo and self.lock:
 			lock_check = gtk.CheckButton(label=_('Lock'))
 			lock_check.set_active(self.channel_locked)
-			lock_check.connect('toggled', self.check, channel, _LOCK)
+			lock_check.connect('toggled', self.check, _LOCK)
 			vbox.pack_end(lock_check, False, False)
+			self.lock_check = lock_check
 
 		self.show_all()
 
 		self.control1 = volume1_control
+		volume1_control.connect('button-release-event', self.released)
 		if self.stereo:
 			self.control2 = volume2_control
+			volume2_control.connect('button-release-event', self.released)
 
 
 	def set_level(self, level):
@@ -143,15 +157,58 @@ class VolumeControl(gtk.Frame):
 		Allow the volume settings to be passed in from the parent.
 		'level' is a tuple of integers from 0-100 as (left, right).
 		"""
-		self.volume1.set_value(level[0])
-		if self.stereo:
-			self.volume2.set_value(level[1])
+		curve = self.curve
+		self.quiet = True
+		try:
+			self.volume1.set_value(curve.position(level[0],
+								self.volume1.get_value()))
+			if self.stereo:
+				self.volume2.set_value(curve.position(level[1],
+								self.volume2.get_value()))
+		finally:
+			self.quiet = False
+
+	def set_curve(self, curve):
+		"""Map the slider positions to levels with a curves.Curve"""
+		self.curve = curve
 
 	def set_recsrc(self, val):
-		try:
-			self.rec_check.set_active(val)
-		except:
-			pass
+		if self.rec:
+			self.quiet = True
+			try:
+				self.rec_check.set_active(val)
+			finally:
+				self.quiet = False
+
+	def set_mute(self, val):
+		if self.mute:
+			self.quiet = True
+			try:
+				self.mute_check.set_active(val)
+			finally:
+				self.quiet = False
+
+	def set_lock(self, val):
+		if self.stereo and self.lock:
+			self.quiet = True
+			try:
+				self.lock_check.set_active(val)
+			finally:
+				self.quiet = False
+
+	def bind(self, channel, label, option_value, level, curve=None):
+		"""
+		Make the widget control another channel with the same option_mask,
+		so a parent can recycle it instead of creating a new one.
+		"""
+		self.channel = channel
+		if curve is not None:
+			self.set_curve(curve)
+		self.set_label(label)
+		self.set_lock(option_value & _LOCK)
+		self.set_mute(option_value & _MUTE)
+		self.set_recsrc(option_value & _REC)
+		self.set_level(level)
 
 	def get_level(self):
 		"""
@@ -160,25 +217,31 @@ class VolumeControl(gtk.Frame):
 		"""
 		return (self.vol_left, self.vol_right)
 
-	def value_changed(self, vol, channel, channel_lr):
+	def value_changed(self, vol, channel_lr):
 		"""
 		Track changes in the volume controls and pass them back to the parent
 		via the 'volume_changed' signal.
 		"""
+		level = self.curve.hardware(vol.get_value())
 		if channel_lr == CHANNEL_LEFT:
-			self.vol_left = int(vol.get_value())
+			self.vol_left = level
 			if self.lock and self.channel_locked:
 				self.volume2.set_value(vol.get_value())
 
 		elif channel_lr == CHANNEL_RIGHT:
-			self.vol_right = int(vol.get_value())
+			self.vol_right = level
 			if self.lock and self.channel_locked:
 				self.volume1.set_value(vol.get_value())
 
 		else:
-			self.vol_left = self.vol_right = int(vol.get_value())
-		self.emit("volume_changed", channel, self.vol_left, self.vol_right)
+			self.vol_left = self.vol_right = level
+		if not self.quiet:
+			self.emit("volume_changed", self.channel, self.vol_left, self.vol_right)
+
 
+	def released(self, widget, event):
+		self.emit('volume_released', self.channel)
+		return False
 
 	def show_values(self, show_value):
 		self.control1.set_draw_value(show_value)
@@ -186,22 +249,23 @@ class VolumeControl(gtk.Frame):
 			self.control2.set_draw_value(show_value)
 
 
-	def check(self, button, channel, id):
+	def check(self, button, id):
 		"""
 		Process the various checkboxes and signal the parent when they change
 		via the 'volume_setting_changed' signal.
 		"""
 		if id == _LOCK:
-			self.channel_locked = not self.channel_locked
+			self.channel_locked = button.get_active()
 			if self.channel_locked:
-				avg_vol = (self.vol_left+self.vol_right)/2
+				avg_vol = (self.volume1.get_value()+self.volume2.get_value())/2
 				self.volume1.set_value(avg_vol)
 				self.volume2.set_value(avg_vol)
 		elif id == _MUTE:
-			self.channel_muted = not self.channel_muted
+			self.channel_muted = button.get_active()
 		elif id == _REC:
-			self.channel_rec = not self.channel_rec
-		self.emit('volume_setting_toggled', channel, id, button.get_active())
+			self.channel_rec = button.get_active()
+		if not self.quiet:
+			self.emit('volume_setting_toggled', self.channel, id, button.get_active())
 
 
 #I need these to be called only once, not each time an instance is created.
@@ -213,3 +277,6 @@ gobject.signal_new('volume_setting_toggled', VolumeControl,
 		gobject.SIGNAL_RUN_LAST, gobject.TYPE_BOOLEAN,
 		(gobject.TYPE_INT, gobject.TYPE_INT, gobject.TYPE_INT))
 
+gobject.signal_new('volume_released', VolumeControl,
+		gobject.SIGNAL_RUN_LAST, gobject.TYPE_BOOLEAN,
+		(gobject.TYPE_INT,))
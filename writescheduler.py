@@ -0,0 +1,73 @@
+"""
+	writescheduler.py (merge volume writes from fast scrolls and drags)
+
+	This program is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; either version 2 of the License.
+
+	This program is distributed in the hope that it will be useful
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+"""
+
+import time
+import gobject
+
+
+class WriteScheduler:
+	"""
+	Rate limits writes to the mixer.
+
+	schedule() replaces any pending write with the same key, so only the
+	latest level of an element is sent.  A write is done at once if nothing
+	was written during the last frame, otherwise it waits for the next
+	frame.  flush() sends everything pending right away, use it when a
+	slider is released or the program quits.
+	"""
+	def __init__(self, rate=60):
+		self.pending = {}
+		self.order = []
+		self.source = None
+		self.last = 0.0
+		self.set_rate(rate)
+
+	def set_rate(self, rate):
+		"""Set the maximum number of flushes per second"""
+		self.interval = 1.0 / max(1, rate)
+
+	def schedule(self, key, write, *args):
+		"""Call 'write(*args)' within one frame, unless replaced before"""
+		if key not in self.pending:
+			self.order.append(key)
+		self.pending[key] = (write, args)
+		if self.source is not None:
+			return
+		wait = self.last + self.interval - time.time()
+		if wait <= 0:
+			self.flush()
+		else:
+			self.source = gobject.timeout_add(int(wait * 1000) + 1, self.timeout)
+
+	def cancel(self, key):
+		"""Drop a pending write"""
+		if key in self.pending:
+			del self.pending[key]
+			self.order.remove(key)
+
+	def timeout(self):
+		self.source = None
+		self.flush()
+		return False
+
+	def flush(self):
+		"""Do all pending writes now"""
+		if self.source is not None:
+			gobject.source_remove(self.source)
+			self.source = None
+		pending, order = self.pending, self.order
+		self.pending, self.order = {}, []
+		self.last = time.time()
+		for key in order:
+			write, args = pending[key]
+			write(*args)